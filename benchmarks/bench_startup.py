@@ -0,0 +1,179 @@
+"""
+Checks the startup cost of commands against budgets
+
+Each command is run in a new Python process, which records the
+time from the start of the import of its module to the end of the
+command, and the modules that were imported.  Every command is run
+with --help, and cp_make_dist also makes the distributions from a
+small set of color maps generated in a temporary directory.
+Commands should only import colour-science, Matplotlib and SciPy
+when they use them, so for each run the median time is compared
+with a budget and none of those packages may have been imported.
+The NumPy bundle computes lightness with colour-science, so it is
+timed separately, against a budget only.  The results are printed
+as JSON, and the exit status is 1 if any check fails.
+
+Run with:
+
+    python benchmarks/bench_startup.py [--runs N] [--output FILE]
+"""
+
+import argparse
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+_MEASURE = r'''
+import importlib
+import json
+import sys
+import time
+
+module_name, _, attribute = sys.argv[1].partition(':')
+start = time.perf_counter()
+command = getattr(importlib.import_module(module_name), attribute)
+command.main(sys.argv[3:], prog_name=sys.argv[2], standalone_mode=False)
+elapsed = time.perf_counter() - start
+
+print(json.dumps({'time': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+# Commands and their entry points
+_COMMANDS = {
+    'cp_print': 'chromophile_dev.cmdline:cmd_print',
+    'cp_make_dist': 'chromophile_dev.cmdline:cmd_make_dist',
+    }
+
+_HEAVY_PACKAGES = ('colour', 'matplotlib', 'scipy')
+
+
+def _measure(command, args):
+    result = subprocess.run(
+        [sys.executable, '-c', _MEASURE, _COMMANDS[command], command, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+        )
+    # The command's output precedes the measurements.
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def _make_fixture(directory):
+    """Writes a gray color map for every alias target to directory
+
+    These are the only color maps the distributions require.
+    """
+
+    import numpy as np
+
+    from chromophile_dev import db, make_dist
+
+    gray = np.repeat(np.arange(256, dtype=np.uint8)[:, np.newaxis], 3, axis=1)
+    for _, name in make_dist.DEFAULT_ALIASES:
+        db.write_cmap(directory / name, gray)
+
+
+def _make_dist_args(cmap_directory, output_directory, distributions):
+    def make_args(run):
+        args = []
+        for distribution in distributions:
+            args.extend(['--distribution', distribution])
+        return [*args, str(cmap_directory), str(output_directory / str(run))]
+
+    return make_args
+
+
+def _check(name, args, runs, budget, allow_heavy=False):
+    """Runs a command runs times and compares it with budget
+
+    args is a function of the run's number returning the command's
+    arguments.
+    """
+
+    results = [_measure(name, args(run)) for run in range(runs)]
+    times = [result['time'] for result in results]
+    median = statistics.median(times)
+    heavy = sorted({
+        package
+        for result in results
+        for package in _HEAVY_PACKAGES
+        if package in result['modules']
+        })
+    return {
+        'median': median,
+        'min': min(times),
+        'max': max(times),
+        'budget': budget,
+        'heavy_imports': heavy,
+        'passed': median <= budget and (allow_heavy or not heavy),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help="Also write the results here")
+    parser.add_argument(
+        '--max-help-time', type=float, default=0.75, help="Seconds",
+        )
+    parser.add_argument(
+        '--max-make-dist-time', type=float, default=1.5, help="Seconds",
+        )
+    parser.add_argument(
+        '--max-numpy-bundle-time', type=float, default=5.0, help="Seconds",
+        )
+    args = parser.parse_args()
+
+    from chromophile_dev import make_dist
+
+    results = {
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'checks': {},
+        }
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        cmap_directory = directory / 'cmaps'
+        cmap_directory.mkdir()
+        _make_fixture(cmap_directory)
+
+        for command in _COMMANDS:
+            results['checks'][f'{command} --help'] = _check(
+                command,
+                lambda run: ['--help'],
+                args.runs,
+                args.max_help_time,
+                )
+
+        without_numpy = [
+            name for name in make_dist.ALL_DISTRIBUTIONS if name != 'numpy'
+            ]
+        results['checks']['cp_make_dist'] = _check(
+            'cp_make_dist',
+            _make_dist_args(cmap_directory, directory / 'dist', without_numpy),
+            args.runs,
+            args.max_make_dist_time,
+            )
+        results['checks']['cp_make_dist --distribution numpy'] = _check(
+            'cp_make_dist',
+            _make_dist_args(cmap_directory, directory / 'numpy', ['numpy']),
+            args.runs,
+            args.max_numpy_bundle_time,
+            allow_heavy=True,
+            )
+
+    failed = not all(check['passed'] for check in results['checks'].values())
+    output = json.dumps(results, indent=4)
+    print(output)
+    if args.output is not None:
+        with open(args.output, 'w') as file_handle:
+            file_handle.write(output + '\n')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
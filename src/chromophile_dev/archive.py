@@ -0,0 +1,243 @@
+"""
+Packed color map archives
+
+An archive holds many color maps in one file.  It begins with a
+fixed-size header:
+
+* the magic bytes MAGIC,
+* the format version, as a little-endian 32-bit integer,
+* the number of color maps, as a little-endian 32-bit integer,
+* the length of the index, as a little-endian 64-bit integer,
+* the offset of the color map data, as a little-endian 64-bit
+  integer.
+
+The index follows.  It is UTF-8 JSON: a list with an entry for
+each color map giving its name, the offset of its data relative
+to the start of the color map data, the length of its data in
+bytes, the uniform space it was made in, and the CRC-32 of its
+data.  The color map data follows the index.  It is the
+concatenation of every color map's sRGB256 colors, three bytes per
+color, in index order.
+
+Archives are read through mmap, so color maps are served as
+memoryviews of the file without copying.  Each color map is
+checked against its CRC-32 when it is read.
+"""
+
+import json
+import mmap
+import os
+import pathlib
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+
+MAGIC = b'CPCMAPS\x00'
+VERSION = 1
+SUFFIX = '.cpa'
+
+_HEADER = struct.Struct('<8sIIQQ')
+
+
+def is_archive(filename):
+    with open(filename, 'rb') as file_handle:
+        return file_handle.read(len(MAGIC)) == MAGIC
+
+
+class Archive:
+    """A color map archive opened for reading
+
+    Color maps are looked up by name and returned as read-only
+    memoryviews into the archive.
+    """
+
+    def __init__(self, filename):
+        self.filename = pathlib.Path(filename)
+        with open(self.filename, 'rb') as file_handle:
+            self._mmap = mmap.mmap(
+                file_handle.fileno(), 0, access=mmap.ACCESS_READ,
+                )
+        self._buffer = memoryview(self._mmap)
+
+        magic, version, count, index_length, data_offset = (
+            _HEADER.unpack_from(self._buffer)
+            )
+        if magic != MAGIC:
+            raise ValueError(f"{self.filename} is not a color map archive")
+        if version != VERSION:
+            raise ValueError(
+                f"{self.filename} has unsupported version {version}"
+                )
+
+        index_bytes = self._buffer[_HEADER.size:_HEADER.size + index_length]
+        self.index = json.loads(bytes(index_bytes))
+        if len(self.index) != count:
+            raise ValueError(f"{self.filename} has a corrupt index")
+        self._data = self._buffer[data_offset:]
+        self._entries = {entry['name']: entry for entry in self.index}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __getitem__(self, name):
+        """Returns a color map's data, checking it against its CRC-32"""
+
+        entry = self._entries[name]
+        data = self._data[entry['offset']:entry['offset'] + entry['length']]
+        if zlib.crc32(data) != entry['crc32']:
+            data.release()
+            raise ValueError(f"Color map {name} in {self.filename} is corrupt")
+        return data
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return [entry['name'] for entry in self.index]
+
+    def items(self):
+        """Returns a list of (name, data) pairs in index order"""
+
+        return [(name, self[name]) for name in self.names()]
+
+    def verify(self):
+        """Raises ValueError if any color map fails its checksum"""
+
+        for name in self.names():
+            self[name].release()
+
+    def close(self):
+        self._entries = {}
+        self._data.release()
+        self._buffer.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Color maps that are still in use keep the mapping
+            # alive until they are released.
+            pass
+
+
+class ArchiveWriter:
+    """Writes color maps to an archive as they are produced
+
+    Color maps added with add are appended to a temporary file next
+    to the archive, so they never need to be held in memory
+    together.  close assembles the archive and atomically replaces
+    filename with it.  If filename already is an archive, color
+    maps in it that were not added again are kept.
+    """
+
+    def __init__(self, filename):
+        self.filename = pathlib.Path(filename)
+        self._entries = {}
+        self._size = 0
+        file_descriptor, temporary_name = tempfile.mkstemp(
+            dir=self.filename.parent, prefix=f'.{self.filename.name}.',
+            )
+        self._temporary_path = pathlib.Path(temporary_name)
+        self._temporary_file = os.fdopen(file_descriptor, 'w+b')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, name, cmap_sRGB256, uniform_space=None):
+        data = memoryview(
+            np.ascontiguousarray(cmap_sRGB256, dtype=np.uint8)
+            ).cast('B')
+        self._temporary_file.write(data)
+        self._temporary_file.flush()
+        self._entries[name] = {
+            'name': name,
+            'offset': self._size,
+            'length': len(data),
+            'uniform_space': uniform_space,
+            'crc32': zlib.crc32(data),
+            }
+        self._size += len(data)
+
+    def close(self):
+        previous = None
+        if self.filename.exists():
+            previous = Archive(self.filename)
+
+        try:
+            self._write(previous)
+        finally:
+            if previous is not None:
+                previous.close()
+            self.abort()
+
+    def _write(self, previous):
+        sources = [(None, entry) for entry in self._entries.values()]
+        if previous is not None:
+            sources.extend(
+                (previous, entry)
+                for entry in previous.index
+                if entry['name'] not in self._entries
+                )
+        sources.sort(key=lambda source: source[1]['name'])
+
+        index = []
+        offset = 0
+        for _, entry in sources:
+            index.append({**entry, 'offset': offset})
+            offset += entry['length']
+        index_bytes = json.dumps(index).encode('utf8')
+
+        output_path = self.filename.with_name(
+            f'.{self.filename.name}.{os.getpid()}'
+            )
+        try:
+            with open(output_path, 'wb') as output:
+                output.write(_HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    len(index),
+                    len(index_bytes),
+                    _HEADER.size + len(index_bytes),
+                    ))
+                output.write(index_bytes)
+                for source, entry in sources:
+                    if source is None:
+                        output.write(os.pread(
+                            self._temporary_file.fileno(),
+                            entry['length'],
+                            entry['offset'],
+                            ))
+                    else:
+                        with source[entry['name']] as data:
+                            output.write(data)
+            os.replace(output_path, self.filename)
+        except BaseException:
+            output_path.unlink(missing_ok=True)
+            raise
+
+    def abort(self):
+        self._temporary_file.close()
+        self._temporary_path.unlink(missing_ok=True)
+
+
+def read_cmaps(filename):
+    """Returns the (name, data) pairs of every color map in an archive
+
+    The data are memoryviews into the archive, which stays open as
+    long as they are referenced.
+    """
+
+    return Archive(filename).items()
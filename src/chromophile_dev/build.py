@@ -0,0 +1,381 @@
+"""
+Incremental builds of the distributions and documentation images
+
+A build is a graph of steps, each of which writes files in the
+build directory:
+
+* cmap:NAME optimizes the state NAME, writing its parameters to
+  parameters/NAME.json and its colors to cmaps/NAME.dat (or to
+  NAME_dark.dat and NAME_light.dat for cylinders).
+
+* dist:NAME makes the distribution NAME in dist/NAME from every
+  color map's colors.
+
+* images renders a color bar for every color map in the Python
+  distribution, including reversed and rearranged ones.
+
+Every step has a key: a hash of its settings and of the files it
+reads, which are the outputs of the steps it depends on.  The
+manifest, build.json, records each step's key and the hashes of
+the files it wrote.  A step is skipped if its key is unchanged and
+its files are intact, so after a change to one state only that
+state's steps and the steps downstream of it run.  Images are only
+rewritten if their contents changed.
+
+Steps whose dependencies are done run in parallel in a pool of
+processes.
+"""
+
+import concurrent.futures
+import hashlib
+import importlib.metadata
+import importlib.resources
+import importlib.util
+import io
+import json
+import os
+import pathlib
+import sys
+
+import networkx as nx
+
+from . import cache, db, lazy, make_dist, run
+
+PIL_Image = lazy.import_module('PIL.Image')
+
+
+MANIFEST = 'build.json'
+PARAMETERS = 'parameters'
+CMAPS = 'cmaps'
+DIST = 'dist'
+IMAGES = 'images'
+
+
+def _hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hash_file(path):
+    return _hash_bytes(path.read_bytes())
+
+
+def _hash_json(data):
+    return _hash_bytes(json.dumps(data, sort_keys=True).encode('utf8'))
+
+
+def _hash_tree(traversable):
+    """Hashes the names and contents of every file in a tree"""
+
+    hashes = {}
+    unprocessed = [(traversable, '')]
+    while unprocessed:
+        current, name = unprocessed.pop()
+        if current.is_dir():
+            for child in current.iterdir():
+                if child.name != '__pycache__':
+                    unprocessed.append((child, f"{name}/{child.name}"))
+        else:
+            hashes[name] = _hash_bytes(current.read_bytes())
+    return _hash_json(hashes)
+
+
+def _make_cmap(data, runtime):
+    output, _ = run.create_buffered(data, runtime)
+    return output, None
+
+
+def _make_distribution(name, cmap_paths, output_directory):
+    cmaps = [
+        (path.stem, db.read_cmap(path))
+        for path in map(pathlib.Path, cmap_paths)
+        ]
+    written = make_dist.make_distributions((name,), cmaps, output_directory)
+
+    distribution_directory = output_directory / name
+    outputs = sorted(
+        str(path) for path in distribution_directory.rglob('*')
+        if path.is_file() and '__pycache__' not in path.parts
+        )
+    return (
+        f"Made distribution {name}, writing {len(written)} of"
+        f" {len(outputs)} files\n",
+        outputs,
+        )
+
+
+def _load_python_distribution(directory):
+    """Imports the chromophile package in a Python distribution"""
+
+    package_directory = directory / 'chromophile'
+    spec = importlib.util.spec_from_file_location(
+        'chromophile',
+        package_directory / '__init__.py',
+        submodule_search_locations=[str(package_directory)],
+        )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['chromophile'] = module
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        del sys.modules['chromophile']
+    return module
+
+
+def _make_images(distribution_directory, image_directory):
+    chromophile = _load_python_distribution(distribution_directory)
+
+    image_directory.mkdir(parents=True, exist_ok=True)
+    outputs = []
+    num_written = 0
+    for name, cmap_data in chromophile._cmaps:
+        cmap_bytes = bytes(b for color in cmap_data for b in color)
+        im = PIL_Image.frombytes(
+            'RGB', (len(cmap_bytes) // 3, 1), cmap_bytes,
+            )
+        png = io.BytesIO()
+        im.save(png, format='PNG')
+
+        # Unchanged images are left alone, so that tools watching
+        # them do not rebuild needlessly.
+        path = image_directory / f"{name}.png"
+        if not path.exists() or path.read_bytes() != png.getvalue():
+            path.write_bytes(png.getvalue())
+            num_written += 1
+        outputs.append(str(path))
+
+    return f"Wrote {num_written} of {len(outputs)} images\n", outputs
+
+
+def _cmap_outputs(build_directory, name, data):
+    """Returns the files the cmap step for a state writes"""
+
+    parameters = json.loads(data)['parameters']
+    if parameters.get('cylinder'):
+        cmap_names = (f"{name}_dark", f"{name}_light")
+    else:
+        cmap_names = (name,)
+
+    return [
+        build_directory / PARAMETERS / f"{name}.json",
+        *(build_directory / CMAPS / f"{n}.dat" for n in cmap_names),
+        ]
+
+
+def make_graph(
+        build_directory,
+        states,
+        distributions,
+        image_directory=None,
+        optimize=True,
+        ):
+    """Returns the build graph
+
+    states is a list of pairs of a state's name and its serialized
+    data.  Each node is a step.  Its attributes are its settings,
+    the function that runs it and that function's arguments, and
+    the files it writes, if they are known beforehand.  Functions
+    return their output and the files they wrote, or None if they
+    are as expected.
+    """
+
+    graph = nx.DiGraph()
+    versions = cache.package_versions()
+
+    cmap_paths = []
+    for name, data in states:
+        outputs = _cmap_outputs(build_directory, name, data)
+        cmap_paths.extend(outputs[1:])
+        runtime = {
+            'cvd': False,
+            'cvd_severity': 1.0,
+            'display': False,
+            'optimize': optimize,
+            'verbose_optimize': 0,
+            'verbose_post_process': 0,
+            'output_color_map': build_directory / CMAPS / name,
+            'output_parameters': build_directory / PARAMETERS / name,
+            'output_archive': None,
+            'cache': None,
+            }
+        graph.add_node(
+            f"cmap:{name}",
+            settings={
+                'state': data, 'optimize': optimize, 'versions': versions,
+                },
+            function=_make_cmap,
+            args=(data, runtime),
+            outputs=outputs,
+            )
+
+    dist_directory = importlib.resources.files(make_dist.__package__)
+    for name in distributions:
+        graph.add_node(
+            f"dist:{name}",
+            settings={
+                'distribution': name,
+                'configuration': make_dist.DISTRIBUTIONS[name],
+                'version': importlib.metadata.version(make_dist.__package__),
+                'templates': _hash_tree(
+                    dist_directory / 'distributions' / name
+                    ),
+                },
+            function=_make_distribution,
+            args=(
+                name,
+                [str(path) for path in cmap_paths],
+                build_directory / DIST,
+                ),
+            outputs=None,
+            )
+        for state_name, _ in states:
+            graph.add_edge(f"cmap:{state_name}", f"dist:{name}")
+
+    if image_directory is not None and 'python' in distributions:
+        graph.add_node(
+            'images',
+            settings={'image_directory': str(image_directory)},
+            function=_make_images,
+            args=(build_directory / DIST / 'python', image_directory),
+            outputs=None,
+            )
+        graph.add_edge('dist:python', 'images')
+
+    return graph
+
+
+def read_manifest(build_directory):
+    try:
+        with open(build_directory / MANIFEST) as file_handle:
+            return json.load(file_handle)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_manifest(build_directory, manifest):
+    path = build_directory / MANIFEST
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}")
+    try:
+        with open(temporary_path, 'w') as file_handle:
+            json.dump(manifest, file_handle, indent=4, sort_keys=True)
+        os.replace(temporary_path, path)
+    except BaseException:
+        temporary_path.unlink(missing_ok=True)
+        raise
+
+
+def _step_key(graph, manifest, step):
+    inputs = {}
+    for dependency in sorted(graph.predecessors(step)):
+        inputs.update(manifest[dependency]['outputs'])
+    return _hash_json(
+        {'settings': graph.nodes[step]['settings'], 'inputs': inputs}
+        )
+
+
+def _is_up_to_date(manifest, step, key):
+    entry = manifest.get(step)
+    if entry is None or entry['key'] != key:
+        return False
+
+    for path, output_hash in entry['outputs'].items():
+        try:
+            if _hash_file(pathlib.Path(path)) != output_hash:
+                return False
+        except FileNotFoundError:
+            return False
+    return True
+
+
+def build(graph, build_directory, jobs=1, force=False, verbose=True):
+    """Runs the steps of graph that are out of date
+
+    Steps run as soon as the steps they depend on are done.  The
+    manifest is updated after each step, so an interrupted build
+    resumes where it stopped.  Returns the names of the steps that
+    ran.
+    """
+
+    if not nx.is_directed_acyclic_graph(graph):
+        raise ValueError("The build graph has a cycle")
+
+    for subdirectory in (PARAMETERS, CMAPS, DIST):
+        (build_directory / subdirectory).mkdir(parents=True, exist_ok=True)
+
+    manifest = {
+        step: entry
+        for step, entry in read_manifest(build_directory).items()
+        if step in graph
+        }
+    remaining = {step: graph.in_degree(step) for step in graph}
+    ready = [step for step, count in remaining.items() if count == 0]
+    running = {}
+    ran = []
+    failure = None
+
+    def finish(step):
+        for successor in graph.successors(step):
+            remaining[successor] -= 1
+            if remaining[successor] == 0:
+                ready.append(successor)
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        while ready or running:
+            while ready and failure is None:
+                step = ready.pop()
+                key = _step_key(graph, manifest, step)
+                if not force and _is_up_to_date(manifest, step, key):
+                    finish(step)
+                    continue
+
+                node = graph.nodes[step]
+                future = executor.submit(node['function'], *node['args'])
+                running[future] = (step, key)
+
+            if not running:
+                break
+
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+            for future in done:
+                step, key = running.pop(future)
+                try:
+                    output, outputs = future.result()
+                except Exception as exc:
+                    print(f"{step} failed: {exc}", file=sys.stderr)
+                    failure = failure or exc
+                    continue
+
+                if verbose:
+                    print(f"Built {step}")
+                    print(output, end='')
+                if outputs is None:
+                    outputs = graph.nodes[step]['outputs']
+                manifest[step] = {
+                    'key': key,
+                    'outputs': {
+                        str(path): _hash_file(pathlib.Path(path))
+                        for path in outputs
+                        },
+                    }
+                _write_manifest(build_directory, manifest)
+                ran.append(step)
+                finish(step)
+
+    if failure is not None:
+        raise failure
+
+    return ran
+
+
+def library_states(regexps=('',)):
+    """Returns the names and data of library states matching any regexp"""
+
+    resources = importlib.resources.files(db.DATA_PACKAGE)
+    names = sorted({
+        entry['name'] for regexp in regexps for entry in db.query(regexp)
+        })
+    return [
+        (name, (resources / f"{name}.json").read_text(encoding='utf8'))
+        for name in names
+        ]
@@ -0,0 +1,137 @@
+"""
+A content-addressed cache of cp_edit's results
+
+Making a color map is slow: optimizing it can take minutes, and
+so can approximating it in sRGB.  Both depend only on the color
+map's persistent state, on whether it is optimized, and on the
+versions of the libraries doing the work, so their results are
+cached under a hash of those.
+
+Each entry is a JSON file holding the optimized cmap section, with
+angles in radians as the optimizer left them, and the color map's
+sRGB256 colors.  Entries are evicted least recently used first
+once the cache exceeds its maximum size.  An entry's modification
+time records when it was last used.
+"""
+
+import base64
+import hashlib
+import importlib.metadata
+import json
+import os
+import pathlib
+
+import numpy as np
+import platformdirs
+
+from . import model
+
+
+DEFAULT_DIRECTORY = pathlib.Path(
+    platformdirs.user_cache_dir(__package__, appauthor=False)
+    ) / 'results'
+DEFAULT_MAX_SIZE = 256 * 2**20
+
+# Libraries whose versions can change optimized color maps.
+VERSIONED_PACKAGES = (__package__, 'numpy', 'scipy', 'colour-science')
+
+
+def package_versions():
+    """Returns the versions of VERSIONED_PACKAGES"""
+
+    versions = {}
+    for package in VERSIONED_PACKAGES:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+class ResultCache:
+    """Optimized color maps and their sRGB256 colors, by state"""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_size=DEFAULT_MAX_SIZE):
+        self.directory = pathlib.Path(directory)
+        self.max_size = max_size
+        self.versions = package_versions()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.evict()
+
+    def key(self, state):
+        """Returns the key of a state that has not been optimized"""
+
+        data = json.dumps(
+            {
+                'state': state.to_dict(),
+                'optimize': bool(state['optimize']),
+                'versions': self.versions,
+                },
+            sort_keys=True,
+            )
+        return hashlib.sha256(data.encode('utf8')).hexdigest()
+
+    def _path(self, key):
+        return self.directory / f"{key}.json"
+
+    def get(self, key):
+        """Returns the entry stored under key, or None
+
+        An entry is a dict with the optimized cmap section, as a
+        CmapData in radians, and the sRGB256 colors.
+        """
+
+        path = self._path(key)
+        try:
+            with open(path) as file_handle:
+                entry = json.load(file_handle)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # A damaged entry is dropped and recomputed.
+            path.unlink(missing_ok=True)
+            return None
+
+        cmap_sRGB256 = np.frombuffer(
+            base64.b64decode(entry['sRGB256']), dtype=np.uint8,
+            ).reshape(entry['shape'])
+        return {
+            'cmap': model.CmapData.from_dict(entry['cmap'], 'cmap'),
+            'sRGB256': cmap_sRGB256.copy(),
+            }
+
+    def put(self, key, cmap_data, cmap_sRGB256):
+        entry = {
+            'cmap': cmap_data.to_dict(),
+            'shape': cmap_sRGB256.shape,
+            'sRGB256': base64.b64encode(
+                np.ascontiguousarray(cmap_sRGB256, dtype=np.uint8)
+                ).decode('ascii'),
+            }
+
+        path = self._path(key)
+        temporary_path = path.with_name(f".{path.name}.{os.getpid()}")
+        with open(temporary_path, 'w') as file_handle:
+            json.dump(entry, file_handle)
+        os.replace(temporary_path, path)
+
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until under max_size"""
+
+        entries = []
+        for path in self.directory.glob('*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            size -= entry_size
@@ -1,10 +1,25 @@
+import contextlib
 import importlib
+import importlib.resources
+import json
+import os
 import pathlib
+import time
 
 import click
 import numpy as np
 
-from . import db, display, fmt, make_dist, run, search
+from . import archive, cache, daemon_client, fmt, lazy, make_dist
+
+# These are only loaded by the commands that use them.
+build = lazy.import_module('.build', __package__)
+daemon = lazy.import_module('.daemon', __package__)
+db = lazy.import_module('.db', __package__)
+display = lazy.import_module('.display', __package__)
+results = lazy.import_module('.results', __package__)
+run = lazy.import_module('.run', __package__)
+search = lazy.import_module('.search', __package__)
+workqueue = lazy.import_module('.workqueue', __package__)
 
 
 class AngleParamType(click.ParamType):
@@ -60,6 +75,9 @@ FLOAT_SEQUENCE = FloatSequenceParamType()
 ANGLE_SEQUENCE = AngleSequenceParamType()
 
 
+CMAP_TYPE = click.Choice(['Multisequential', 'Divergent', 'Cyclic', 'Gray'])
+
+
 def validate_sequence_data(ctx, param, value):
     if len(value) % 2 == 1:
         raise click.BadParameter(
@@ -72,16 +90,50 @@ def validate_sequence_data(ctx, param, value):
     return value
 
 
+def validate_cmap_output(ctx, param, value):
+    if value is None or value.suffix == archive.SUFFIX:
+        return value
+
+    if not value.is_dir():
+        raise click.BadParameter(
+            f"{value} is neither a directory nor a {archive.SUFFIX} archive"
+            )
+
+    return value
+
+
+def _selected_data(name, regexp, cmap_type, file):
+    """Yields the serialized color maps selected by command-line options
+
+    Library color maps are found using the library's index and
+    read only when they are reached.
+    """
+
+    for n in name:
+        yield db.read(n)
+    for r in regexp:
+        yield from map(db.load_data, db.query(r))
+    for t in cmap_type:
+        yield from map(db.load_data, db.query('', t))
+    for f in file:
+        yield f.read()
+
+
+def _selected_states(name, regexp, cmap_type, file):
+    """Yields the color maps selected by command-line options"""
+
+    return map(db.deserialize, _selected_data(name, regexp, cmap_type, file))
+
+
 @click.command()
 @click.option(
     '--output-color-map', '-O',
-    type=click.Path(
-        exists=True,
-        file_okay=False,
-        writable=True,
-        path_type=pathlib.Path,
+    type=click.Path(writable=True, path_type=pathlib.Path),
+    callback=validate_cmap_output,
+    help=(
+        "Output color map bytes to the given directory, or to the given"
+        f" archive if it ends in {archive.SUFFIX}"
         ),
-    help="Output color map bytes to the given directory",
     )
 @click.option(
     '--output-parameters', '-o',
@@ -124,6 +176,48 @@ def validate_sequence_data(ctx, param, value):
     count=True,
     help="Print color map post-processing information",
     )
+@click.option(
+    '--jobs',
+    '-j',
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of color maps to make at once, in separate processes",
+    )
+@click.option(
+    '--cache/--no-cache',
+    default=True,
+    help="Reuse color maps made earlier from the same parameters",
+    )
+@click.option(
+    '--cache-directory',
+    type=click.Path(file_okay=False, writable=True, path_type=pathlib.Path),
+    default=cache.DEFAULT_DIRECTORY,
+    show_default=True,
+    help="Directory in which to cache color maps",
+    )
+@click.option(
+    '--cache-size',
+    type=click.FloatRange(min=0.0),
+    default=cache.DEFAULT_MAX_SIZE / 2**20,
+    show_default=True,
+    help=(
+        "Size in MiB above which the least recently used color maps"
+        " are removed from the cache"
+        ),
+    )
+@click.option(
+    '--daemon/--no-daemon',
+    default=True,
+    help=(
+        "Make color maps in the daemon started by cp_daemon, if it is"
+        " running"
+        ),
+    )
+@click.option(
+    '--daemon-socket',
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Socket of the daemon",
+    )
 @click.option(
     '--name',
     '-n',
@@ -138,6 +232,14 @@ def validate_sequence_data(ctx, param, value):
     multiple=True,
     help="Regular expression for color maps to edit",
     )
+@click.option(
+    '--type',
+    '-t',
+    'cmap_type',
+    type=CMAP_TYPE,
+    multiple=True,
+    help="Type of color maps to edit",
+    )
 @click.option(
     '--file',
     '-f',
@@ -145,53 +247,105 @@ def validate_sequence_data(ctx, param, value):
     multiple=True,
     help="File containing color map to edit",
     )
-def cmd_edit(name, regexp, file, **kwargs):
+def cmd_edit(name, regexp, cmap_type, file, jobs, **kwargs):
     """Re-optimize a color map
 
     The color maps to optimize should be specified by name, by
-    regular expression, or by file.
+    regular expression, by type, or by file.
+
+    Color maps are cached under a hash of their parameters and the
+    versions of the libraries used to make them, so editing a color
+    map again is fast unless something changed.
+
+    With --jobs, each color map's output is printed once it is
+    finished, in the same order as without --jobs.
+
+    If cp_daemon is running, color maps that are not displayed are
+    made by the daemon, which has already loaded what they need,
+    and --jobs is ignored.
     """
 
-    states = []
-    for n in name:
-        states.append(db.lookup(n))
-    for r in regexp:
-        states.extend(db.lookup_regexp(r))
-    for f in file:
-        states.append(db.deserialize(f.read()))
+    if jobs > 1 and kwargs['display']:
+        raise click.UsageError("--display cannot be used with --jobs")
 
-    for arg in (
-            'cvd',
-            'cvd_severity',
-            'display',
-            'optimize',
-            'verbose_optimize',
-            'verbose_post_process',
-            ):
-        for state in states:
-            state[arg] = kwargs[arg]
+    client = None
+    daemon_socket = kwargs.pop('daemon_socket')
+    if kwargs.pop('daemon') and not kwargs['display']:
+        client = daemon_client.connect(daemon_socket)
 
-    for arg in (
-            'output_color_map',
-            'output_parameters',
-            ):
-        if (val := kwargs[arg]) is not None:
-            for state in states:
-                state[arg] = val / f'{state["name"]}'
+    result_cache = None
+    if kwargs.pop('cache'):
+        result_cache = cache.ResultCache(
+            kwargs.pop('cache_directory'),
+            int(kwargs.pop('cache_size') * 2**20),
+            )
+
+    with contextlib.ExitStack() as stack:
+        # Color maps are added to an archive as they are made.  The
+        # archive is only replaced once every color map succeeds.
+        output_archive = None
+        if (
+                kwargs['output_color_map'] is not None
+                and kwargs['output_color_map'].suffix == archive.SUFFIX
+                ):
+            output_archive = stack.enter_context(
+                archive.ArchiveWriter(kwargs['output_color_map'])
+                )
+            kwargs['output_color_map'] = pathlib.Path()
+
+        def runtime(cmap_name):
+            runtime = {
+                arg: kwargs[arg]
+                for arg in (
+                    'cvd',
+                    'cvd_severity',
+                    'display',
+                    'optimize',
+                    'verbose_optimize',
+                    'verbose_post_process',
+                    )
+                }
+            for arg in (
+                    'output_color_map',
+                    'output_parameters',
+                    ):
+                if (val := kwargs[arg]) is not None:
+                    runtime[arg] = val / cmap_name
+                else:
+                    runtime[arg] = None
+            runtime['output_archive'] = output_archive
+            runtime['cache'] = result_cache
+            return runtime
+
+        selected = (name, regexp, cmap_type, file)
+        if client is not None:
+            # States are sent as they were read, so that only the
+            # daemon deserializes them.
+            def jobs():
+                for data in _selected_data(*selected):
+                    job_runtime = runtime(json.loads(data)['name'])
+                    if output_archive is not None:
+                        job_runtime['output_archive'] = True
+                    yield data, job_runtime
+
+            results = client.create(list(jobs()))
         else:
-            for state in states:
-                state[arg] = None
-
-    type_lookup_table = {
-        'Multisequential': run.create_multiseq,
-        'Divergent': run.create_divergent,
-        'Cyclic': run.create_cyclic,
-        'Gray': run.create_gray,
-        }
+            def edited_states():
+                for state in _selected_states(*selected):
+                    state.runtime.update(runtime(state.name))
+                    yield state
 
-    for state in states:
-        print(f"Processing {state['name']}")
-        type_lookup_table[state['type']](state)
+            if jobs == 1:
+                for state in edited_states():
+                    print(f"Processing {state.name}")
+                    run.CREATE_FUNCTIONS[state.type](state)
+                return
+            results = run.create_in_parallel(edited_states(), jobs)
+
+        for output, cmaps in results:
+            print(output, end='')
+            for cmap_args in cmaps:
+                output_archive.add(*cmap_args)
 
 
 @click.command()
@@ -209,6 +363,14 @@ def cmd_edit(name, regexp, file, **kwargs):
     multiple=True,
     help="Regular expression for color maps to print",
     )
+@click.option(
+    '--type',
+    '-t',
+    'cmap_type',
+    type=CMAP_TYPE,
+    multiple=True,
+    help="Type of color maps to print",
+    )
 @click.option(
     '--file',
     '-f',
@@ -216,16 +378,10 @@ def cmd_edit(name, regexp, file, **kwargs):
     multiple=True,
     help="File containing color map to print",
     )
-def cmd_print(name, regexp, file):
+def cmd_print(name, regexp, cmap_type, file):
     """Print color map parameters as an RST table"""
 
-    states = []
-    for n in name:
-        states.append(db.lookup(n))
-    for r in regexp:
-        states.extend(db.lookup_regexp(r))
-    for f in file:
-        states.append(db.deserialize(f.read()))
+    states = list(_selected_states(name, regexp, cmap_type, file))
 
     print(".. list-table::")
     print("   :header-rows: 1")
@@ -620,8 +776,7 @@ def cmd_multisequential(state, **kwargs):
 
     state['parameters'].update(kwargs)
 
-    db.initialize_state(state)
-    run.create_multiseq(state)
+    run.create_multiseq(db.initialize_state(state))
 
 
 @cmd_create.command("divergent")
@@ -841,8 +996,7 @@ def cmd_divergent(state, **kwargs):
 
     state['parameters'].update(kwargs)
 
-    db.initialize_state(state)
-    run.create_divergent(state)
+    run.create_divergent(db.initialize_state(state))
 
 
 @cmd_create.command("cyclic")
@@ -1047,8 +1201,7 @@ def cmd_cyclic(state, **kwargs):
 
     state['parameters'].update(kwargs)
 
-    db.initialize_state(state)
-    run.create_cyclic(state)
+    run.create_cyclic(db.initialize_state(state))
 
 
 @cmd_create.command("gray")
@@ -1087,8 +1240,7 @@ def cmd_gray(state, **kwargs):
 
     state['parameters'].update(kwargs)
 
-    db.initialize_state(state)
-    run.create_gray(state)
+    run.create_gray(db.initialize_state(state))
 
 
 @click.group()
@@ -1131,6 +1283,83 @@ def cmd_gray(state, **kwargs):
     type=click.Path(file_okay=False, path_type=pathlib.Path),
     help="Directory in which to generate output files",
     )
+@click.option(
+    '--warm-start/--cold-start',
+    default=False,
+    help=(
+        "Start each optimization from the solution of the nearest"
+        " candidate solved so far"
+        ),
+    )
+@click.option(
+    '--early-stop/--no-early-stop',
+    default=False,
+    help=(
+        "Stop optimizations that seem unable to reach the lightness"
+        " threshold or that have stalled"
+        ),
+    )
+@click.option(
+    '--stall-iterations',
+    default=50,
+    type=click.IntRange(min=1),
+    help=(
+        "Number of iterations without progress after which an"
+        " optimization is considered stalled"
+        ),
+    )
+@click.option(
+    '--time-budget',
+    type=click.FloatRange(min=0.0),
+    help=(
+        "Wall-clock time in seconds after which no new candidates are"
+        " attempted.  Candidates are attempted most promising first."
+        ),
+    )
+@click.option(
+    '--verbose', '-v',
+    count=True,
+    help="Print a message about every candidate",
+    )
+@click.option(
+    '--progress-interval',
+    default=10.0,
+    type=click.FloatRange(min=0.0),
+    help="Seconds between progress reports",
+    )
+@click.option(
+    '--records',
+    type=click.File('w', encoding='utf8'),
+    help="Write a JSON record for every candidate to the given file",
+    )
+@click.option(
+    '--results-db',
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Store every candidate in the given SQLite database",
+    )
+@click.option(
+    '--queue-directory',
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    help=(
+        "Divide the search into tasks in this shared directory instead"
+        " of searching.  The tasks are run by cp_queue work."
+        ),
+    )
+@click.option(
+    '--chunk-size',
+    default=100,
+    type=click.IntRange(min=1),
+    help="Number of candidates in each queued task",
+    )
+@click.option(
+    '--lease-time',
+    default=600.0,
+    type=click.FloatRange(min=1.0),
+    help=(
+        "Seconds without a sign of life after which a queued task's"
+        " worker is presumed dead and the task is re-issued"
+        ),
+    )
 @click.pass_context
 def cmd_search(
         ctx,
@@ -1140,8 +1369,46 @@ def cmd_search(
         colorfulness,
         similarity_threshold,
         output_directory,
+        warm_start,
+        early_stop,
+        stall_iterations,
+        time_budget,
+        verbose,
+        progress_interval,
+        records,
+        results_db,
+        queue_directory,
+        chunk_size,
+        lease_time,
         ):
-    """Search for new color maps"""
+    """Search for new color maps
+
+    Progress is reported periodically: candidates per minute,
+    accepted and rejected candidates by reason, mean optimization
+    time, and an estimate of the time remaining.  With --records,
+    each candidate's outcome is also written to a file as one
+    line of JSON.  With --results-db, candidates are stored in an
+    SQLite database that cp_query can select color maps from.
+
+    With --time-budget, accepted color maps are written when the
+    budget runs out, and the candidates that were not attempted
+    are listed in not_attempted.json in the output directory.
+
+    With --queue-directory, the search is divided into tasks that
+    are run by cp_queue work, possibly on several machines sharing
+    the directory.  cp_queue merge then writes the accepted color
+    maps.
+    """
+
+    if queue_directory is not None and (
+            time_budget is not None
+            or records is not None
+            or results_db is not None
+            ):
+        raise click.UsageError(
+            "--queue-directory cannot be combined with --time-budget,"
+            " --records, or --results-db"
+            )
 
     ctx.ensure_object(dict)
 
@@ -1152,6 +1419,68 @@ def cmd_search(
     state['colorfulness'] = colorfulness
     state['similarity_threshold'] = similarity_threshold
     state['output_directory'] = output_directory
+    state['search_options'] = {
+        'warm_start': warm_start,
+        'early_stop': early_stop,
+        'stall_iterations': stall_iterations,
+        }
+    state['queue'] = None
+    if queue_directory is not None:
+        state['queue'] = {
+            'directory': queue_directory,
+            'chunk_size': chunk_size,
+            'lease_time': lease_time,
+            }
+        return
+
+    state['search_options']['log'] = search.SearchLog(
+        verbose,
+        progress_interval,
+        records,
+        None if results_db is None else results.ResultStore(results_db),
+        )
+    if time_budget is not None:
+        state['search_options']['deadline'] = time.monotonic() + time_budget
+
+
+def _write_search_results(obj, found_states):
+    log = obj['search_options']['log']
+    log.finish()
+    if log.store is not None:
+        log.store.close()
+
+    for state in found_states:
+        db.write_state(obj['output_directory'] / state['name'], state)
+
+    if 'deadline' in obj['search_options']:
+        not_attempted = log.not_attempted
+        print(f"{len(not_attempted)} candidates were not attempted.")
+        with open(
+                obj['output_directory'] / 'not_attempted.json', 'w',
+                ) as file_handle:
+            json.dump(not_attempted, file_handle, indent=4)
+
+
+def _run_search(obj, function, args, kwargs):
+    """Runs or queues search.<function>(*args, **kwargs)"""
+
+    if obj['queue'] is not None:
+        num_chunks = workqueue.create(
+            obj['queue']['directory'],
+            function,
+            args,
+            kwargs,
+            obj['search_options'],
+            obj['queue']['chunk_size'],
+            obj['queue']['lease_time'],
+            )
+        print(f"Created {num_chunks} tasks in {obj['queue']['directory']}.")
+        return
+
+    found_states = getattr(search, function)(
+        *args, **kwargs, **obj['search_options'],
+        )
+    _write_search_results(obj, found_states)
 
 
 @cmd_search.command("mseq")
@@ -1173,26 +1502,41 @@ def cmd_search(
     default=0,
     help="Add extra revolutions to every directed arc"
     )
+@click.option(
+    "--prune/--no-prune",
+    default=False,
+    help=(
+        "Skip combinations of arcs whose single-arc lightness ranges"
+        " cannot meet the lightness threshold"
+        ),
+    )
 @click.argument("num_seqs", type=int)
 @click.pass_obj
 def cmd_search_mseq(
-        obj, num_seqs, max_arc_length, min_arc_length, num_extra_revolutions,
-        ):
-    results = search.make_mseq(
-        obj['num_samples'],
-        obj['span'],
-        obj['lightness_threshold'],
-        obj['colorfulness'],
-        obj['similarity_threshold'],
+        obj,
         num_seqs,
         max_arc_length,
         min_arc_length,
         num_extra_revolutions,
+        prune,
+        ):
+    _run_search(
+        obj,
+        'make_mseq',
+        [
+            obj['num_samples'],
+            obj['span'],
+            obj['lightness_threshold'],
+            obj['colorfulness'],
+            obj['similarity_threshold'],
+            num_seqs,
+            max_arc_length,
+            min_arc_length,
+            num_extra_revolutions,
+            ],
+        {'prune_arcs': prune},
         )
 
-    for state in results:
-        db.write_state(obj['output_directory'] / state['name'], state)
-
 
 @cmd_search.command("div")
 @click.option(
@@ -1209,34 +1553,38 @@ def cmd_search_mseq(
     )
 @click.pass_obj
 def cmd_search_div(obj, max_arc_length, min_arc_length):
-    results = search.make_div(
-        obj['num_samples'],
-        obj['span'],
-        obj['lightness_threshold'],
-        obj['colorfulness'],
-        obj['similarity_threshold'],
-        max_arc_length,
-        min_arc_length,
+    _run_search(
+        obj,
+        'make_div',
+        [
+            obj['num_samples'],
+            obj['span'],
+            obj['lightness_threshold'],
+            obj['colorfulness'],
+            obj['similarity_threshold'],
+            max_arc_length,
+            min_arc_length,
+            ],
+        {},
         )
 
-    for state in results:
-        db.write_state(obj['output_directory'] / state['name'], state)
-
 
 @cmd_search.command("cyc")
 @click.pass_obj
 def cmd_search_cyc(obj):
-    results = search.make_cyc(
-        obj['num_samples'],
-        obj['span'],
-        obj['lightness_threshold'],
-        obj['colorfulness'],
-        obj['similarity_threshold'],
+    _run_search(
+        obj,
+        'make_cyc',
+        [
+            obj['num_samples'],
+            obj['span'],
+            obj['lightness_threshold'],
+            obj['colorfulness'],
+            obj['similarity_threshold'],
+            ],
+        {},
         )
 
-    for state in results:
-        db.write_state(obj['output_directory'] / state['name'], state)
-
 
 @cmd_search.command("isolum")
 @click.option(
@@ -1253,17 +1601,271 @@ def cmd_search_cyc(obj):
     )
 @click.pass_obj
 def cmd_search_isolum(obj, max_arc_length, min_arc_length):
-    results = search.make_isolum(
-        obj['num_samples'],
-        obj['span'],
-        obj['colorfulness'],
-        obj['similarity_threshold'],
-        max_arc_length,
-        min_arc_length,
+    _run_search(
+        obj,
+        'make_isolum',
+        [
+            obj['num_samples'],
+            obj['span'],
+            obj['colorfulness'],
+            obj['similarity_threshold'],
+            max_arc_length,
+            min_arc_length,
+            ],
+        {},
         )
 
-    for state in results:
-        db.write_state(obj['output_directory'] / state['name'], state)
+
+@click.command()
+@click.option(
+    '--search-id', '-s',
+    type=int,
+    multiple=True,
+    help="Only consider the search with this ID",
+    )
+@click.option(
+    '--regexp', '-r',
+    type=str,
+    help="Only consider candidates whose names match this regexp",
+    )
+@click.option(
+    '--lightness-threshold',
+    type=float,
+    help="Minimum lightness difference (default: the search's)",
+    )
+@click.option(
+    '--similarity-threshold',
+    type=float,
+    help=(
+        "Angular distance below which two sequences will be considered"
+        " duplicates (default: the search's)"
+        ),
+    )
+@click.option(
+    '--output-directory',
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    help="Write the selected color maps to this directory",
+    )
+@click.argument(
+    'database',
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+    )
+def cmd_query(
+        search_id,
+        regexp,
+        lightness_threshold,
+        similarity_threshold,
+        output_directory,
+        database,
+        ):
+    """Select color maps from a search results database
+
+    Solved candidates stored by cp_search --results-db are judged
+    again with the given thresholds, without optimizing them
+    again.  The selected color maps are listed and, with
+    --output-directory, written as color map parameters.
+    """
+
+    connection = results.connect(database)
+    for row in connection.execute("SELECT * FROM searches ORDER BY id"):
+        if search_id and row['id'] not in search_id:
+            continue
+        print(
+            f"Search {row['id']}: {row['type']}, started {row['started']},"
+            f" lightness threshold {row['lightness_threshold']},"
+            f" similarity threshold {row['similarity_threshold']}"
+            )
+
+    count = 0
+    for state in results.select(
+            connection,
+            search_id,
+            regexp,
+            lightness_threshold,
+            similarity_threshold,
+            ):
+        count += 1
+        lightness_diff = (
+            state['cmap']['final_lightness']
+            - state['cmap']['initial_lightness']
+            )
+        print(f"{state['name']}: lightness difference {lightness_diff:.4f}")
+        if output_directory is not None:
+            db.write_state(output_directory / state['name'], state)
+
+    print(f"Selected {count} color maps.")
+
+
+@click.group()
+def cmd_queue():
+    """Run searches queued by cp_search --queue-directory"""
+
+
+@cmd_queue.command("work")
+@click.option(
+    '--poll-interval',
+    default=10.0,
+    type=click.FloatRange(min=0.0),
+    help="Seconds to wait between checks for re-issued tasks",
+    )
+@click.option(
+    '--verbose', '-v',
+    count=True,
+    help="Print a message about every candidate",
+    )
+@click.option(
+    '--progress-interval',
+    default=60.0,
+    type=click.FloatRange(min=0.0),
+    help="Seconds between progress reports",
+    )
+@click.argument(
+    'queue_directory',
+    type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path),
+    )
+def cmd_queue_work(poll_interval, verbose, progress_interval, queue_directory):
+    """Run queued tasks until every task is done
+
+    Any number of workers may share a queue directory.
+    """
+
+    count = workqueue.work(
+        queue_directory, poll_interval, verbose, progress_interval,
+        )
+    print(f"Completed {count} tasks.")
+
+
+@cmd_queue.command("status")
+@click.argument(
+    'queue_directory',
+    type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path),
+    )
+def cmd_queue_status(queue_directory):
+    """Print the number of pending, leased, and finished tasks"""
+
+    for k, v in workqueue.status(queue_directory).items():
+        print(f"{k}: {v}")
+
+
+@cmd_queue.command("merge")
+@click.option(
+    '--results-db',
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help=(
+        "SQLite database in which to combine the results"
+        " (default: results.db in the queue directory)"
+        ),
+    )
+@click.option(
+    '--output-directory',
+    default='.',
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    help="Directory in which to write the accepted color maps",
+    )
+@click.argument(
+    'queue_directory',
+    type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path),
+    )
+def cmd_queue_merge(results_db, output_directory, queue_directory):
+    """Combine the results of a finished queue
+
+    Every candidate is judged again with the search's thresholds
+    and compared with the color maps accepted before it in the
+    full search, so the result does not depend on how the search
+    was divided.  The combined results can be examined further
+    with cp_query.
+    """
+
+    if results_db is None:
+        results_db = queue_directory / 'results.db'
+
+    connection = workqueue.merge(queue_directory, results_db)
+    count = 0
+    for state in results.select(connection):
+        db.write_state(output_directory / state['name'], state)
+        count += 1
+    print(f"Accepted {count} color maps.")
+
+
+@click.command()
+@click.argument(
+    'directory',
+    required=False,
+    type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path),
+    )
+def cmd_index(directory):
+    """Index a directory of color maps
+
+    The directory defaults to the color map library.  The index
+    lets color maps be found by name or type without reading every
+    file.  It should be rebuilt whenever a color map changes; until
+    it is, every file is read.
+    """
+
+    if directory is None:
+        directory = pathlib.Path(
+            str(importlib.resources.files(db.DATA_PACKAGE))
+            )
+
+    entries = db.build_index(directory)
+    print(f"Indexed {len(entries)} color maps in {directory}.")
+
+
+@click.command()
+@click.option(
+    '--socket',
+    'socket_path',
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="Socket on which to listen",
+    )
+@click.option(
+    '--jobs',
+    '-j',
+    type=click.IntRange(min=1),
+    default=os.cpu_count(),
+    show_default=True,
+    help="Number of color maps to make at once, in separate processes",
+    )
+@click.option(
+    '--uniform-space',
+    type=str,
+    multiple=True,
+    help=(
+        "Uniform color space whose sRGB nearest neighbors to load"
+        " [default: every space in the library]"
+        ),
+    )
+@click.option(
+    '--stop',
+    is_flag=True,
+    help="Stop the running daemon",
+    )
+def cmd_daemon(socket_path, jobs, uniform_space, stop):
+    """Make color maps for cp_edit in the background
+
+    The daemon loads everything needed to make color maps once,
+    then makes the color maps cp_edit sends it until it is stopped.
+    """
+
+    if socket_path is None:
+        socket_path = daemon_client.default_socket_path()
+
+    if stop:
+        client = daemon_client.connect(socket_path)
+        if client is None:
+            raise click.UsageError(f"No daemon is listening on {socket_path}")
+        client.stop()
+        return
+
+    if not uniform_space:
+        uniform_space = sorted(
+            {entry['uniform_space'] for entry in db.read_index()}
+            )
+
+    try:
+        daemon.Daemon(socket_path, jobs, uniform_space).run()
+    except RuntimeError as exc:
+        raise click.UsageError(str(exc))
 
 
 @click.command()
@@ -1275,24 +1877,132 @@ def cmd_search_isolum(obj, max_arc_length, min_arc_length):
     default=make_dist.ALL_DISTRIBUTIONS,
     help="Only remake this distribution",
     )
+@click.option(
+    '--jobs',
+    '-j',
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of files to make at once, in separate threads",
+    )
 @click.argument(
     'cmap_directory',
-    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    type=click.Path(exists=True, path_type=pathlib.Path),
     )
 @click.argument(
     'output_directory',
     type=click.Path(file_okay=False, path_type=pathlib.Path),
     )
-def cmd_make_dist(distribution, cmap_directory, output_directory):
+def cmd_make_dist(distribution, jobs, cmap_directory, output_directory):
     """Make Chromophile distributions
 
     The CMAP_DIRECTORY argument should contain the data files
-    produced by 'cp_edit -O'.  The final distributions will be
-    placed in OUTPUT_DIRECTORY.
+    produced by 'cp_edit -O', or be an archive produced by
+    'cp_edit -O FILE.cpa'.  The final distributions will be placed
+    in OUTPUT_DIRECTORY.  Files that are already up to date are
+    left alone.
     """
 
-    all_cmaps = db.read_cmap_dir(cmap_directory)
-    make_dist.make_distributions(distribution, all_cmaps, output_directory)
+    if cmap_directory.is_dir():
+        all_cmaps = db.read_cmap_dir(cmap_directory)
+    else:
+        all_cmaps = archive.read_cmaps(cmap_directory)
+    written = make_dist.make_distributions(
+        distribution, all_cmaps, output_directory, jobs,
+        )
+    print(f"Wrote {len(written)} files")
+
+
+@click.command()
+@click.option(
+    '--distribution',
+    '-d',
+    multiple=True,
+    type=click.Choice(make_dist.ALL_DISTRIBUTIONS),
+    default=make_dist.ALL_DISTRIBUTIONS,
+    help="Only build this distribution",
+    )
+@click.option(
+    '--regexp',
+    '-r',
+    type=str,
+    multiple=True,
+    default=('',),
+    help="Regular expression for color maps to build",
+    )
+@click.option(
+    '--optimize/--no-optimize',
+    default=True,
+    help="Whether to optimize the color maps"
+    )
+@click.option(
+    '--images/--no-images',
+    default=True,
+    help="Whether to render color bars of the Python distribution",
+    )
+@click.option(
+    '--image-directory',
+    type=click.Path(file_okay=False, writable=True, path_type=pathlib.Path),
+    help=(
+        "Directory in which to render color bars"
+        " [default: BUILD_DIRECTORY/images]"
+        ),
+    )
+@click.option(
+    '--jobs',
+    '-j',
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of steps to run at once, in separate processes",
+    )
+@click.option(
+    '--force',
+    is_flag=True,
+    help="Rerun every step, even if it is up to date",
+    )
+@click.argument(
+    'build_directory',
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    )
+def cmd_build(
+        distribution,
+        regexp,
+        optimize,
+        images,
+        image_directory,
+        jobs,
+        force,
+        build_directory,
+        ):
+    """Incrementally build distributions from the color map library
+
+    Color maps are made from the library's parameters, the
+    distributions are made from the color maps, and color bars for
+    the documentation are rendered from the Python distribution.
+    Everything is placed in BUILD_DIRECTORY.  Steps whose inputs are
+    unchanged since the last build are skipped.
+    """
+
+    if not images:
+        image_directory = None
+    elif image_directory is None:
+        image_directory = build_directory / build.IMAGES
+
+    states = build.library_states(regexp)
+    if not states:
+        raise click.UsageError("No color maps match")
+
+    graph = build.make_graph(
+        build_directory,
+        states,
+        distribution,
+        image_directory=image_directory,
+        optimize=optimize,
+        )
+    ran = build.build(graph, build_directory, jobs=jobs, force=force)
+    print(
+        f"Ran {len(ran)} of {graph.number_of_nodes()} steps;"
+        " the rest were up to date."
+        )
 
 
 @click.command()
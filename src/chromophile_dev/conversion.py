@@ -3,10 +3,12 @@ Color conversion
 """
 
 import collections
+import collections.abc
 import functools
 import heapq
 import itertools
 import operator
+import os
 import pathlib
 import pickle
 import time
@@ -37,7 +39,6 @@ def sRGB_nearest_neighbors_cache_path(space):
     return cache_path
 
 
-@functools.cache
 def sRGB_nearest_neighbors_get_cached(space, verbose):
     cache_path = sRGB_nearest_neighbors_cache_path(space)
 
@@ -60,8 +61,14 @@ def sRGB_nearest_neighbors_get_cached(space, verbose):
 def sRGB_nearest_neighbors_store_cached(space, kd_tree):
     cache_path = sRGB_nearest_neighbors_cache_path(space)
 
-    with open(cache_path, 'wb') as handle:
+    # Several processes may generate the structure at once, so it
+    # is written to a temporary file and moved into place.
+    temporary_path = cache_path.with_name(
+        f".{cache_path.name}.{os.getpid()}"
+        )
+    with open(temporary_path, 'wb') as handle:
         pickle.dump(kd_tree, handle)
+    os.replace(temporary_path, cache_path)
 
 
 def sRGB_nearest_neighbors_generate(conversions, verbose):
@@ -87,14 +94,23 @@ def sRGB_nearest_neighbors_generate(conversions, verbose):
     return kd_tree
 
 
+# The structures loaded by this process, by uniform space.
+_sRGB_nearest_neighbors = {}
+
+
 def sRGB_nearest_neighbors_structure(
         space, conversions, verbose,
         ):
+    kd_tree = _sRGB_nearest_neighbors.get(space)
+    if kd_tree is not None:
+        return kd_tree
+
     kd_tree = sRGB_nearest_neighbors_get_cached(space, verbose)
     if kd_tree is None:
         kd_tree = sRGB_nearest_neighbors_generate(conversions, verbose)
         sRGB_nearest_neighbors_store_cached(space, kd_tree)
 
+    _sRGB_nearest_neighbors[space] = kd_tree
     return kd_tree
 
 
@@ -106,9 +122,8 @@ def unpack_sRGB_indices(packed):
     return unpacked
 
 
-def uniform_space_conversions(space):
-    space = space.lower()
-
+@functools.cache
+def _uniform_space_conversions(space):
     # The following function is undocumented, but it's precisely
     # what we need.
     conversion_path = colour.graph.conversion._conversion_path
@@ -133,6 +148,46 @@ def uniform_space_conversions(space):
     return sRGB_to_uniform, uniform_to_sRGB
 
 
+def uniform_space_conversions(space):
+    """Returns functions converting sRGB to space and back
+
+    The conversion paths are resolved once per space, and every
+    caller receives the same functions.
+    """
+
+    return _uniform_space_conversions(space.lower())
+
+
+class Conversions(collections.abc.Mapping):
+    """The conversions between sRGB and a uniform space
+
+    This is a mapping with the keys 'sRGB_to_uniform' and
+    'uniform_to_sRGB'.  The conversions are not resolved until one
+    of them is first used.
+    """
+
+    KEYS = ('sRGB_to_uniform', 'uniform_to_sRGB')
+
+    def __init__(self, space):
+        self.space = space
+
+    def __getitem__(self, key):
+        try:
+            index = self.KEYS.index(key)
+        except ValueError:
+            raise KeyError(key) from None
+        return uniform_space_conversions(self.space)[index]
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.space!r})"
+
+
 def sRGB1_validity(x):
     """Returns booleans indicating where x defines valid sRGB1 points
 
@@ -0,0 +1,154 @@
+"""
+A daemon that makes color maps for cp_edit
+
+The client, which cp_edit uses, is in daemon_client.
+
+Starting cp_edit means importing colour-science and Matplotlib,
+resolving color conversions, and loading the sRGB nearest neighbors
+structures, which can take longer than making a color map.  The
+daemon does this once, then makes color maps sent to it over a Unix
+domain socket in a pool of worker processes that share what it
+loaded.
+
+Messages in both directions are pickles preceded by their length
+as a little-endian 64-bit integer.  A request is a dict with a
+command.  'create' makes color maps: the request holds the
+client's working directory and a list of (data, runtime) pairs, as
+for run.create_buffered, and the daemon replies with one message
+per color map, in order.  The states are sent serialized, so the
+client never deserializes them.  'version' replies with the
+package version, and 'stop' stops the daemon.
+
+Only the user running the daemon can connect to its socket, which
+is created without permissions for anyone else, and connections
+from other users are refused where the peer can be identified, so
+unpickling requests trusts no one else.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import pathlib
+import pickle
+import socket
+import struct
+import traceback
+
+from . import daemon_client, run
+
+
+# struct ucred: a pid, a uid, and a gid
+_CREDENTIALS = struct.Struct('3i')
+
+
+def _is_own_peer(sock):
+    """Returns whether sock is connected to a process of this user
+
+    Where the peer cannot be identified, the socket's permissions
+    are relied on.
+    """
+
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    credentials = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, _CREDENTIALS.size,
+        )
+    _, uid, _ = _CREDENTIALS.unpack(credentials)
+    return uid == os.getuid()
+
+
+def _create(cwd, data, runtime):
+    """Makes one color map in a worker, relative to the client's cwd"""
+
+    os.chdir(cwd)
+    try:
+        return 'ok', run.create_buffered(data, runtime)
+    except Exception:
+        return 'error', traceback.format_exc()
+
+
+class Daemon:
+    def __init__(self, socket_path, jobs, spaces):
+        self.socket_path = pathlib.Path(socket_path)
+        self.jobs = jobs
+        self.spaces = spaces
+
+    async def _read(self, reader):
+        length, = daemon_client.LENGTH.unpack(
+            await reader.readexactly(daemon_client.LENGTH.size)
+            )
+        return pickle.loads(await reader.readexactly(length))
+
+    async def _write(self, writer, message):
+        data = pickle.dumps(message)
+        writer.write(daemon_client.LENGTH.pack(len(data)) + data)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        if not _is_own_peer(writer.get_extra_info('socket')):
+            writer.close()
+            return
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        try:
+            request = await self._read(reader)
+            if request['command'] == 'version':
+                await self._write(writer, daemon_client.version())
+            elif request['command'] == 'stop':
+                await self._write(writer, 'stopping')
+                self._stopped.set()
+            elif request['command'] == 'create':
+                futures = [
+                    loop.run_in_executor(
+                        self._executor, _create, request['cwd'], *args,
+                        )
+                    for args in request['jobs']
+                    ]
+                for future in futures:
+                    await self._write(writer, await future)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # The client went away; its remaining color maps are not
+            # needed.
+            pass
+        finally:
+            for future in futures:
+                future.cancel()
+            writer.close()
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        # The socket is never accessible to others, even briefly.
+        umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(
+                self._handle, path=self.socket_path,
+                )
+        finally:
+            os.umask(umask)
+        async with server:
+            print(f"Listening on {self.socket_path}", flush=True)
+            await self._stopped.wait()
+
+    def run(self):
+        if daemon_client.connect(self.socket_path) is not None:
+            raise RuntimeError(
+                f"A daemon is already listening on {self.socket_path}"
+                )
+        self.socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.socket_path.unlink(missing_ok=True)
+
+        # Everything is loaded before the workers are forked, so that
+        # they share it.
+        print(f"Loading {', '.join(self.spaces)}", flush=True)
+        run.load_nearest_neighbors(self.spaces)
+        with concurrent.futures.ProcessPoolExecutor(
+                self.jobs,
+                initializer=run.load_nearest_neighbors,
+                initargs=(self.spaces,),
+                ) as self._executor:
+            self._executor.submit(int).result()
+            try:
+                asyncio.run(self._serve())
+            finally:
+                self.socket_path.unlink(missing_ok=True)
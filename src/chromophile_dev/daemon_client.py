@@ -0,0 +1,100 @@
+"""
+The client of the daemon started by cp_daemon
+
+This module imports nothing that the daemon exists to load, so
+cp_edit can hand color maps to the daemon without importing
+colour-science, Matplotlib or SciPy.  See daemon for the protocol.
+"""
+
+import importlib.metadata
+import os
+import pathlib
+import pickle
+import socket
+import struct
+import sys
+import warnings
+
+import platformdirs
+
+
+SOCKET_NAME = 'daemon.sock'
+
+LENGTH = struct.Struct('<Q')
+
+
+def default_socket_path():
+    with warnings.catch_warnings():
+        # Without XDG_RUNTIME_DIR, platformdirs warns and falls back
+        # to a private directory in /tmp, which is fine.
+        warnings.simplefilter('ignore')
+        directory = platformdirs.user_runtime_dir(__package__, appauthor=False)
+    return pathlib.Path(directory) / SOCKET_NAME
+
+
+def version():
+    return importlib.metadata.version(__package__)
+
+
+class Client:
+    """A connection to a running daemon"""
+
+    def __init__(self, socket_path):
+        self.socket_path = pathlib.Path(socket_path)
+
+    def _request(self, request):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(str(self.socket_path))
+        with sock, sock.makefile('rwb') as stream:
+            data = pickle.dumps(request)
+            stream.write(LENGTH.pack(len(data)) + data)
+            stream.flush()
+            while header := stream.read(LENGTH.size):
+                length, = LENGTH.unpack(header)
+                yield pickle.loads(stream.read(length))
+
+    def version(self):
+        return next(self._request({'command': 'version'}))
+
+    def stop(self):
+        return next(self._request({'command': 'stop'}))
+
+    def create(self, jobs):
+        """Yields what the daemon made for each job
+
+        Each job is a serialized state and its runtime keys, as for
+        run.create_buffered.
+        """
+
+        request = {'command': 'create', 'cwd': os.getcwd(), 'jobs': jobs}
+        for status, result in self._request(request):
+            if status == 'error':
+                raise RuntimeError(f"The daemon failed:\n{result}")
+            yield result
+
+
+def connect(socket_path=None):
+    """Returns a Client if a daemon is listening, otherwise None
+
+    A daemon running a different version of the package is ignored.
+    """
+
+    if socket_path is None:
+        socket_path = default_socket_path()
+
+    client = Client(socket_path)
+    try:
+        daemon_version = client.version()
+    except (OSError, StopIteration):
+        # There is no daemon, or there is a socket that cannot be
+        # used, such as another user's.
+        return None
+
+    if daemon_version != version():
+        print(
+            f"Ignoring the daemon at {socket_path}, which runs version"
+            f" {daemon_version}",
+            file=sys.stderr,
+            )
+        return None
+    return client
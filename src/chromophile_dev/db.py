@@ -1,93 +1,224 @@
-import collections.abc
+import functools
+import hashlib
 import importlib.resources
 import json
+import os
 import pathlib
 import re
+import warnings
 
 import numpy as np
 
-from . import conversion
+from . import lazy, model
 
+conversion = lazy.import_module('.conversion', __package__)
 
-PERSISTENT_STATE_KEYS = (
-    'name',
-    'type',
-    'cmap',
-    'parameters',
-    'opt_parameters',
-    'post_opt_parameters',
-    )
 
 DATA_PACKAGE = f"{__package__}.data"
 
+# The index has a dunder name so that it is never mistaken for a
+# color map.
+INDEX_RESOURCE = '__index__.json'
 
-def initialize_state(state):
-    sRGB_to_uniform, uniform_to_sRGB = conversion.uniform_space_conversions(
-        state['parameters']['uniform_space']
-        )
 
-    state['conversions'] = {
-        'sRGB_to_uniform': sRGB_to_uniform,
-        'uniform_to_sRGB': uniform_to_sRGB,
-        }
+def initialize_state(data):
+    """Returns a validated state made from a dict
 
-    for v in state.values():
-        if not isinstance(v, dict):
-            continue
+    data is not modified.  Its angles must be in degrees.
+    """
 
-        for k1, v1 in v.items():
-            if isinstance(v1, str):
-                continue
-            if isinstance(v1, (collections.abc.Sequence, float)):
-                v[k1] = np.array(v1)
+    state = model.State.from_dict(data)
+    # Conversions are resolved when first used, so states that are
+    # only inspected cost no more than parsing.
+    state['conversions'] = conversion.Conversions(
+        state['parameters']['uniform_space']
+        )
+    return state
 
 
 def serialize(state):
-    persistent_data = {}
-    for k in PERSISTENT_STATE_KEYS:
-        v = state[k]
-        if isinstance(v, dict):
-            for k1, v1 in v.items():
-                if isinstance(v1, np.ndarray):
-                    if v1.size == 1:
-                        v1 = v1.item()
-                    else:
-                        v1 = (*map(float, v1),)
-                v[k1] = v1
-        persistent_data[k] = v
-
-    persistent_data = {k: state[k] for k in PERSISTENT_STATE_KEYS}
-    return json.dumps(persistent_data, indent=4)
+    return json.dumps(state.to_dict(), indent=4)
 
 
 def deserialize(data):
-    state = json.loads(data)
-    initialize_state(state)
-    return state
+    return initialize_state(json.loads(data))
 
 
-def lookup(name):
+def read(name):
+    """Returns the serialized state of a library color map"""
+
     if not name.endswith('.json'):
         name += '.json'
 
     with importlib.resources.open_text(DATA_PACKAGE, name) as file_handle:
-        data = file_handle.read()
+        return file_handle.read()
 
-    state = deserialize(data)
-    return state
+
+def lookup(name):
+    return deserialize(read(name))
 
 
-def lookup_regexp(regexp):
-    for resource in importlib.resources.files(DATA_PACKAGE).iterdir():
-        res_name = pathlib.Path(str(resource)).stem
-        if res_name.startswith('__') and res_name.endswith('__'):
-            continue
-        if re.search(regexp, res_name):
-            with resource.open(encoding='utf8') as file_handle:
-                data = file_handle.read()
+def _is_cmap_resource(name):
+    path = pathlib.PurePath(name)
+    return (
+        path.suffix == '.json'
+        and not (path.stem.startswith('__') and path.stem.endswith('__'))
+        )
+
+
+def index_entry(data):
+    """Returns the library index entry of a serialized state
+
+    The entry describes the state without deserializing it: its
+    name, type, uniform space, sample counts, and the size and a
+    hash of data, used to detect states that changed after
+    indexing.
+    """
+
+    state = json.loads(data)
+    parameters = state['parameters']
+    return {
+        'name': state['name'],
+        'type': state['type'],
+        'uniform_space': parameters['uniform_space'],
+        'num_sequences': max(1, np.size(state['cmap']['sequence_data']) // 2),
+        'num_samples_per_sequence': parameters['num_samples_per_sequence'],
+        'constraint_samples_per_sequence': parameters.get(
+            'constraint_samples_per_sequence'
+            ),
+        'Jp_final_samples': state['post_opt_parameters']['Jp_final_samples'],
+        'size': len(data.encode('utf8')),
+        'sha256': hashlib.sha256(data.encode('utf8')).hexdigest(),
+        }
+
+
+def build_index(directory):
+    """Writes an index of the color maps in directory"""
+
+    entries = [
+        index_entry(path.read_text(encoding='utf8'))
+        for path in sorted(directory.iterdir())
+        if _is_cmap_resource(path.name)
+        ]
+
+    with open(directory / INDEX_RESOURCE, 'w') as file_handle:
+        json.dump(entries, file_handle, indent=4)
+        print(file=file_handle)
+
+    return entries
+
+
+def _scan_index(resources):
+    return [
+        index_entry(resource.read_text(encoding='utf8'))
+        for resource in sorted(resources.iterdir(), key=lambda r: r.name)
+        if _is_cmap_resource(resource.name)
+        ]
+
 
-            state = deserialize(data)
-            yield state
+def _resource_size(resource):
+    try:
+        return os.stat(resource).st_size
+    except TypeError:
+        # Resources outside the file system, such as in a zip file,
+        # cannot be statted.
+        return len(resource.read_bytes())
+
+
+def _is_stale(resources, entries):
+    """Returns whether the library has changed since it was indexed
+
+    The index is stale if color maps were added or removed or if
+    any has a different size from the one recorded.  Only the sizes
+    are checked, so a state that changed without changing size is
+    caught by load, which checks its hash.
+    """
+
+    names = {
+        resource.name
+        for resource in resources.iterdir()
+        if _is_cmap_resource(resource.name)
+        }
+    if names != {f"{entry['name']}.json" for entry in entries}:
+        return True
+
+    return any(
+        entry.get('size')
+        != _resource_size(resources / f"{entry['name']}.json")
+        for entry in entries
+        )
+
+
+@functools.cache
+def read_index():
+    """Returns the index of the color map library
+
+    If the library has not been indexed, or has changed since it
+    was, the index is built in memory, which requires reading but
+    not deserializing every state.
+    """
+
+    resources = importlib.resources.files(DATA_PACKAGE)
+    index = resources / INDEX_RESOURCE
+    if not index.is_file():
+        return _scan_index(resources)
+
+    entries = json.loads(index.read_text(encoding='utf8'))
+    if _is_stale(resources, entries):
+        warnings.warn(
+            "The color map library has changed since it was indexed."
+            "  Run cp_index to update the index.",
+            stacklevel=2,
+            )
+        return _scan_index(resources)
+    return entries
+
+
+def query(regexp='', cmap_type=None):
+    """Returns the index entries of matching color maps
+
+    Color maps match if their name matches regexp and, if
+    cmap_type is not None, if their type is cmap_type.
+    """
+
+    return [
+        entry
+        for entry in read_index()
+        if re.search(regexp, entry['name'])
+        and (cmap_type is None or entry['type'] == cmap_type)
+        ]
+
+
+def load_data(entry):
+    """Returns the serialized state described by an index entry"""
+
+    resources = importlib.resources.files(DATA_PACKAGE)
+    data = (resources / f"{entry['name']}.json").read_text(encoding='utf8')
+    if hashlib.sha256(data.encode('utf8')).hexdigest() != entry['sha256']:
+        # The state is current even though its entry is not.
+        warnings.warn(
+            f"{entry['name']} has changed since the color map library was"
+            " indexed.  Run cp_index to update the index.",
+            stacklevel=2,
+            )
+    return data
+
+
+def load(entry):
+    """Deserializes the color map described by an index entry"""
+
+    return deserialize(load_data(entry))
+
+
+def lookup_regexp(regexp, cmap_type=None):
+    """Yields matching color maps from the library
+
+    Matching is done against the library's index, and each state
+    is only deserialized when it is reached.
+    """
+
+    for entry in query(regexp, cmap_type):
+        yield load(entry)
 
 
 def write_state(filename, state):
@@ -116,21 +247,3 @@ def read_cmap_dir(directory):
 
     return cmaps
 
-
-def _convert_with_function(state, func):
-    for v in state.values():
-        if isinstance(v, dict):
-            for k1, v1 in v.items():
-                if (
-                        k1 == 'sequence_data'
-                        or ('hue' in k1 and 'weight' not in k1)
-                        ):
-                    v[k1] = func(v1)
-
-
-def convert_to_radians(state):
-    _convert_with_function(state, np.deg2rad)
-
-
-def convert_to_degrees(state):
-    _convert_with_function(state, np.rad2deg)
@@ -546,13 +546,7 @@ def colorspace_plot(
     if output is not None:
         fig.tight_layout(pad=0)
 
-    sRGB_to_uniform, uniform_to_sRGB = conversion.uniform_space_conversions(
-        uniform_space,
-        )
-    conversions = {
-        'sRGB_to_uniform': sRGB_to_uniform,
-        'uniform_to_sRGB': uniform_to_sRGB,
-        }
+    conversions = conversion.Conversions(uniform_space)
 
     extent = ((extent[0], extent[1]), (extent[2], extent[3]))
 
@@ -722,13 +716,7 @@ def colorspace_plot(
 
 
 def colormap_plot(uniform_space, cmap_name):
-    sRGB_to_uniform, uniform_to_sRGB = (
-        conversion.uniform_space_conversions(uniform_space)
-        )
-    conversions = {
-        'sRGB_to_uniform': sRGB_to_uniform,
-        'uniform_to_sRGB': uniform_to_sRGB,
-        }
+    conversions = conversion.Conversions(uniform_space)
 
     cmap_obj = mpl.cm.get_cmap(cmap_name)
     if isinstance(cmap_obj, mpl.colors.ListedColormap):
@@ -0,0 +1,62 @@
+"""
+Compares chromophile.apply with Matplotlib's colormaps
+
+Run with:
+
+    python benchmarks/bench_apply.py [--size N] [--threads N]
+"""
+
+import argparse
+import os
+import timeit
+
+import numpy as np
+import matplotlib.colors
+
+import chromophile as cp
+
+
+def _best_time(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=4096)
+    parser.add_argument('--threads', type=int, default=os.cpu_count())
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    name = 'cp_dawn'
+    mpl_cmap = cp.cmap[name]
+    print(
+        f"{args.size}x{args.size} values; best of {args.repeat};"
+        f" {args.threads} threads"
+        )
+    print(f"{'dtype':<10}{'Matplotlib':>12}{'apply':>12}{'threads':>12}")
+    for dtype in ('float64', 'float32', 'uint16', 'uint8'):
+        data = rng.uniform(0, 255, size=(args.size, args.size)).astype(dtype)
+        norm = matplotlib.colors.Normalize(0, 255)
+        out = np.empty(data.shape + (3,), dtype=np.uint8)
+
+        mpl_time = _best_time(
+            lambda: mpl_cmap(norm(data), bytes=True), args.repeat,
+            )
+        apply_time = _best_time(
+            lambda: cp.apply(data, name, 0, 255, out=out), args.repeat,
+            )
+        threads_time = _best_time(
+            lambda: cp.apply(
+                data, name, 0, 255, out=out, num_threads=args.threads,
+                ),
+            args.repeat,
+            )
+        print(
+            f"{dtype:<10}{mpl_time:>11.3f}s{apply_time:>11.3f}s"
+            f"{threads_time:>11.3f}s"
+            )
+
+
+if __name__ == '__main__':
+    main()
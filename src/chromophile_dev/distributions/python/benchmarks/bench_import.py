@@ -0,0 +1,145 @@
+"""
+Checks the cost of importing chromophile against budgets
+
+Each measurement is made in a new Python process: the time to
+import chromophile, the memory that importing it takes, and the
+time to make the first color map in `palette` and in `cmap`.
+Matplotlib is imported before the first color map in `cmap` is
+made, and its import is not counted.  The median of the runs is
+compared with the budgets.  The results are printed as JSON, and
+the exit status is 1 if any budget is exceeded.
+
+Run with:
+
+    python benchmarks/bench_import.py [--runs N] [--output FILE]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+
+_MEASURE = r'''
+import json
+import os
+import sys
+import time
+
+
+def resident_memory():
+    # Linux reports the resident set size in /proc.  Elsewhere, the
+    # peak resident set size is the best available.
+    try:
+        with open('/proc/self/statm') as file_handle:
+            pages = int(file_handle.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+name = sys.argv[1]
+memory_before = resident_memory()
+start = time.perf_counter()
+import chromophile
+import_time = time.perf_counter() - start
+import_memory = resident_memory() - memory_before
+
+start = time.perf_counter()
+chromophile.palette[name]
+palette_time = time.perf_counter() - start
+
+cmap_time = None
+if chromophile.cmap is not None:
+    import matplotlib.colors
+
+    start = time.perf_counter()
+    chromophile.cmap[name]
+    cmap_time = time.perf_counter() - start
+
+print(json.dumps({
+    'version': chromophile.__version__,
+    'num_cmaps': len(chromophile.palette),
+    'import_time': import_time,
+    'import_memory': import_memory,
+    'palette_time': palette_time,
+    'cmap_time': cmap_time,
+    }))
+'''
+
+# Measurements and the options giving their budgets
+_BUDGETS = {
+    'import_time': 'max_import_time',
+    'import_memory': 'max_import_memory',
+    'palette_time': 'max_palette_time',
+    'cmap_time': 'max_cmap_time',
+    }
+
+
+def _measure(name):
+    result = subprocess.run(
+        [sys.executable, '-c', _MEASURE, name],
+        check=True,
+        capture_output=True,
+        text=True,
+        )
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--name', default='cp_dawn')
+    parser.add_argument('--output', help="Also write the results here")
+    parser.add_argument(
+        '--max-import-time', type=float, default=0.2, help="Seconds",
+        )
+    parser.add_argument(
+        '--max-import-memory', type=int, default=16 * 2**20, help="Bytes",
+        )
+    parser.add_argument(
+        '--max-palette-time', type=float, default=0.05, help="Seconds",
+        )
+    parser.add_argument(
+        '--max-cmap-time', type=float, default=0.2, help="Seconds",
+        )
+    args = parser.parse_args()
+
+    runs = [_measure(args.name) for _ in range(args.runs)]
+    results = {
+        'python': sys.version.split()[0],
+        'version': runs[0]['version'],
+        'num_cmaps': runs[0]['num_cmaps'],
+        'runs': args.runs,
+        'measurements': {},
+        }
+    failed = False
+    for measurement, option in _BUDGETS.items():
+        values = [run[measurement] for run in runs]
+        if None in values:
+            continue
+        median = statistics.median(values)
+        budget = getattr(args, option)
+        results['measurements'][measurement] = {
+            'median': median,
+            'min': min(values),
+            'max': max(values),
+            'budget': budget,
+            'passed': median <= budget,
+            }
+        failed = failed or median > budget
+
+    output = json.dumps(results, indent=4)
+    print(output)
+    if args.output is not None:
+        with open(args.output, 'w') as file_handle:
+            file_handle.write(output + '\n')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,403 @@
+# Chromophile Python module
+#
+# Written in 2022 by Kyle Hofmann
+#
+# To the extent possible under law, the author(s) have dedicated
+# all copyright and related and neighboring rights to this
+# software to the public domain worldwide. This software is
+# distributed without any warranty.
+#
+# You should have received a copy of the CC0 Public Domain
+# Dedication along with this software. If not, see
+# <http://creativecommons.org/publicdomain/zero/1.0/>.
+
+"""
+Coloring of data too large for memory, a band of rows at a time
+
+This is the implementation of `chromophile.apply_tiled`.  Data are
+read one tile, a band of consecutive rows, at a time.  While a tile
+is colored, the next one is read and the previous one is written in
+two other threads.
+
+PNG and TIFF files are written here rather than with Pillow, which
+can only write an image that is entirely in memory.
+"""
+
+import concurrent.futures
+import math
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from . import apply
+
+
+# The number of values in a tile, if tile_rows is not given.
+_TILE_SIZE = 2**22
+
+_FORMATS = {'.png': 'png', '.tif': 'tiff', '.tiff': 'tiff'}
+
+
+def _tiles(source, tile_rows):
+    """Returns an iterator over the tiles of source"""
+
+    if hasattr(source, 'shape') and hasattr(source, '__getitem__'):
+        if tile_rows is None:
+            row_size = math.prod(source.shape[1:])
+            tile_rows = max(1, _TILE_SIZE // max(1, row_size))
+        return (
+            source[start:start + tile_rows]
+            for start in range(0, source.shape[0], tile_rows)
+            )
+    return iter(source)
+
+
+def _read(tiles):
+    """Returns the next tile, read into memory, or None"""
+
+    tile = next(tiles, None)
+    if tile is None:
+        return None
+    if isinstance(tile, np.ma.MaskedArray):
+        return tile.copy()
+    return np.array(tile)
+
+
+def limits(source, tile_rows=None):
+    """Returns the least and greatest values of source, ignoring NaNs
+
+    These are the values apply uses when vmin and vmax are not
+    given.  They are NaN if source has no values but NaNs and
+    masked values.
+    """
+
+    vmin = vmax = None
+    for tile in _tiles(source, tile_rows):
+        if isinstance(tile, np.ma.MaskedArray):
+            values = tile.compressed()
+        else:
+            values = np.asarray(tile).reshape(-1)
+        if values.size == 0:
+            continue
+        tile_min = np.fmin.reduce(values)
+        tile_max = np.fmax.reduce(values)
+        vmin = tile_min if vmin is None else np.fmin(vmin, tile_min)
+        vmax = tile_max if vmax is None else np.fmax(vmax, tile_max)
+
+    if vmin is None:
+        return np.nan, np.nan
+    return vmin, vmax
+
+
+class _ArrayWriter:
+    """Writes colors into an array, such as a numpy.memmap"""
+
+    def __init__(self, array):
+        self.array = array
+        self.channels = array.shape[-1]
+
+    def buffer(self, start, shape):
+        return self.array[start:start + shape[0]]
+
+    def write(self, colors):
+        pass
+
+    def close(self, num_rows):
+        if num_rows != len(self.array):
+            raise ValueError(
+                f"There are {num_rows} rows of data, but the destination"
+                f" has {len(self.array)}"
+                )
+
+
+class _ImageWriter:
+    """Writes uint8 colors to an image file"""
+
+    def __init__(self, file_handle, height, channels):
+        self.file_handle = file_handle
+        self.height = height
+        self.channels = channels
+        self.width = None
+        self.num_rows = 0
+        if height is None and not file_handle.seekable():
+            raise ValueError(
+                "Writing to a file that cannot seek needs data of known"
+                " height"
+                )
+        self.origin = file_handle.tell() if file_handle.seekable() else 0
+
+    def buffer(self, start, shape):
+        if len(shape) != 2:
+            raise ValueError(f"Images need 2-D data, not {len(shape)}-D")
+        if self.width is None:
+            self.width = shape[1]
+            self.start()
+        elif shape[1] != self.width:
+            raise ValueError(
+                f"A tile has {shape[1]} columns, not {self.width}"
+                )
+        return np.empty(shape + (self.channels,), dtype=np.uint8)
+
+    def write(self, colors):
+        self.write_rows(colors)
+        self.num_rows += len(colors)
+
+    def close(self, num_rows):
+        if num_rows == 0:
+            raise ValueError("There are no values to color")
+        if self.height is not None and num_rows != self.height:
+            raise ValueError(
+                f"There are {num_rows} rows of data, not {self.height}"
+                )
+        self.finish()
+
+    def patch(self, offset, data):
+        """Overwrites part of what was written already"""
+
+        end = self.file_handle.tell()
+        self.file_handle.seek(self.origin + offset)
+        self.file_handle.write(data)
+        self.file_handle.seek(end)
+
+
+class _PngWriter(_ImageWriter):
+    def _chunk(self, kind, data):
+        crc = zlib.crc32(data, zlib.crc32(kind))
+        return (
+            struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', crc)
+            )
+
+    def _header(self, height):
+        color_type = 6 if self.channels == 4 else 2
+        return self._chunk(
+            b'IHDR',
+            struct.pack(
+                '>IIBBBBB', self.width, height, 8, color_type, 0, 0, 0,
+                ),
+            )
+
+    def start(self):
+        self.file_handle.write(b'\x89PNG\r\n\x1a\n')
+        self.file_handle.write(self._header(self.height or 0))
+        self.compressor = zlib.compressobj()
+        self.previous_row = np.zeros(
+            self.width * self.channels, dtype=np.uint8,
+            )
+
+    def write_rows(self, colors):
+        # Each row is stored as its difference from the row above,
+        # PNG's Up filter, which suits images of smooth data.
+        colors = colors.reshape(len(colors), -1)
+        rows = np.empty((len(colors), colors.shape[1] + 1), dtype=np.uint8)
+        rows[:, 0] = 2
+        np.subtract(colors[:1], self.previous_row, out=rows[:1, 1:])
+        np.subtract(colors[1:], colors[:-1], out=rows[1:, 1:])
+        self.previous_row = colors[-1].copy()
+
+        data = self.compressor.compress(rows)
+        if data:
+            self.file_handle.write(self._chunk(b'IDAT', data))
+
+    def finish(self):
+        self.file_handle.write(self._chunk(b'IDAT', self.compressor.flush()))
+        self.file_handle.write(self._chunk(b'IEND', b''))
+        if self.height is None:
+            self.patch(8, self._header(self.num_rows))
+
+
+# TIFF field types.
+_SHORT = 3
+_LONG = 4
+_LONG8 = 16
+
+_TIFF_DTYPES = {_SHORT: '<u2', _LONG: '<u4', _LONG8: '<u8'}
+
+# Colors start after the largest header, that of a BigTIFF file.
+_TIFF_DATA_OFFSET = 16
+
+_TIFF_STRIP_SIZE = 2**20
+
+
+class _TiffWriter(_ImageWriter):
+    """Writes an uncompressed TIFF file
+
+    The colors follow the header.  The image file directory, which
+    describes them, follows the colors.  Files whose directory
+    would start past 4 GiB are written as BigTIFF.
+    """
+
+    def start(self):
+        self.row_size = self.width * self.channels
+        if self.height is None:
+            self.file_handle.write(bytes(_TIFF_DATA_OFFSET))
+        else:
+            self.file_handle.write(self._header(self.height))
+
+    def _directory_offset(self, height):
+        end = _TIFF_DATA_OFFSET + height * self.row_size
+        return end + end % 2
+
+    def _is_big(self, height):
+        return self._directory_offset(height) + 2**20 >= 2**32
+
+    def _header(self, height):
+        offset = self._directory_offset(height)
+        if self._is_big(height):
+            return b'II' + struct.pack('<HHHQ', 43, 8, 0, offset)
+        return (b'II' + struct.pack('<HI', 42, offset)).ljust(
+            _TIFF_DATA_OFFSET, b'\0',
+            )
+
+    def write_rows(self, colors):
+        self.file_handle.write(colors.tobytes())
+
+    def _directory(self, height):
+        big = self._is_big(height)
+        offset_type = _LONG8 if big else _LONG
+        rows_per_strip = max(1, _TIFF_STRIP_SIZE // self.row_size)
+        strip_starts = np.arange(0, height, rows_per_strip)
+        strip_rows = np.minimum(rows_per_strip, height - strip_starts)
+        entries = [
+            (256, _LONG, [self.width]),
+            (257, _LONG, [height]),
+            (258, _SHORT, [8] * self.channels),
+            (259, _SHORT, [1]),
+            (262, _SHORT, [2]),
+            (
+                273,
+                offset_type,
+                _TIFF_DATA_OFFSET + strip_starts * self.row_size,
+                ),
+            (277, _SHORT, [self.channels]),
+            (278, _LONG, [rows_per_strip]),
+            (279, offset_type, strip_rows * self.row_size),
+            (284, _SHORT, [1]),
+            ]
+        if self.channels == 4:
+            # Unassociated alpha
+            entries.append((338, _SHORT, [2]))
+
+        # Values that do not fit in their entry follow the directory.
+        entry_format, count_format = ('<HHQ', '<Q') if big else ('<HHI', '<H')
+        inline_size = 8 if big else 4
+        offset = self._directory_offset(height) + (
+            struct.calcsize(count_format)
+            + len(entries) * (struct.calcsize(entry_format) + inline_size)
+            + inline_size
+            )
+        fields = []
+        values = bytearray()
+        for tag, field_type, field_values in entries:
+            data = np.asarray(
+                field_values, dtype=_TIFF_DTYPES[field_type],
+                ).tobytes()
+            if len(data) <= inline_size:
+                value = data.ljust(inline_size, b'\0')
+            else:
+                value = struct.pack(
+                    '<' + entry_format[-1], offset + len(values),
+                    )
+                values += data + bytes(len(data) % 2)
+            fields.append(
+                struct.pack(entry_format, tag, field_type, len(field_values))
+                + value
+                )
+
+        return b''.join((
+            struct.pack(count_format, len(entries)),
+            *fields,
+            bytes(inline_size),
+            values,
+            ))
+
+    def finish(self):
+        height = self.num_rows
+        end = _TIFF_DATA_OFFSET + height * self.row_size
+        self.file_handle.write(bytes(self._directory_offset(height) - end))
+        self.file_handle.write(self._directory(height))
+        if self.height is None:
+            self.patch(0, self._header(height))
+
+
+_WRITERS = {'png': _PngWriter, 'tiff': _TiffWriter}
+
+
+def _color(source, name, writer, vmin, vmax, tile_rows, num_threads):
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        tiles = _tiles(source, tile_rows)
+        reading = executor.submit(_read, tiles)
+        writing = None
+        num_rows = 0
+        while (tile := reading.result()) is not None:
+            reading = executor.submit(_read, tiles)
+            colors = writer.buffer(num_rows, tile.shape)
+            apply(tile, name, vmin, vmax, out=colors, num_threads=num_threads)
+            if writing is not None:
+                writing.result()
+            writing = executor.submit(writer.write, colors)
+            num_rows += len(tile)
+        if writing is not None:
+            writing.result()
+    writer.close(num_rows)
+
+
+def apply_tiled(
+        source,
+        name,
+        destination,
+        vmin,
+        vmax,
+        format,
+        alpha,
+        tile_rows,
+        num_threads,
+        ):
+    if vmin is None or vmax is None:
+        if iter(source) is source:
+            raise ValueError(
+                "vmin and vmax must be given to color tiles that can only"
+                " be read once"
+                )
+        source_min, source_max = limits(source, tile_rows)
+        vmin = source_min if vmin is None else vmin
+        vmax = source_max if vmax is None else vmax
+
+    if hasattr(destination, 'shape'):
+        writer = _ArrayWriter(destination)
+        _color(source, name, writer, vmin, vmax, tile_rows, num_threads)
+        return vmin, vmax
+
+    if format is None:
+        try:
+            extension = os.path.splitext(os.fspath(destination))[1]
+            format = _FORMATS[extension.lower()]
+        except (TypeError, KeyError):
+            raise ValueError(
+                f"Cannot tell the format of {destination!r}; give format"
+                ) from None
+    if format not in _WRITERS:
+        raise ValueError(f"Unknown format {format!r}")
+
+    height = source.shape[0] if hasattr(source, 'shape') else None
+    channels = 4 if alpha else 3
+    if hasattr(destination, 'write'):
+        writer = _WRITERS[format](destination, height, channels)
+        _color(source, name, writer, vmin, vmax, tile_rows, num_threads)
+        return vmin, vmax
+
+    # Files are written in full or not at all.
+    path = os.fspath(destination)
+    directory, filename = os.path.split(path)
+    temporary_path = os.path.join(directory, f".{filename}.{os.getpid()}")
+    try:
+        with open(temporary_path, 'wb') as file_handle:
+            writer = _WRITERS[format](file_handle, height, channels)
+            _color(source, name, writer, vmin, vmax, tile_rows, num_threads)
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return vmin, vmax
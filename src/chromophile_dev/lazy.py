@@ -0,0 +1,37 @@
+"""
+Modules that are loaded when first used
+
+Most commands need only a few of this package's modules, and some
+of those import colour-science, Matplotlib and SciPy, which take
+seconds.  A module returned by import_module is registered like
+any other, but its code only runs when one of its attributes is
+first accessed.
+"""
+
+import importlib.util
+import sys
+
+
+def import_module(name, package=None):
+    """Returns the named module, loading it when first used
+
+    name and package are as for importlib.import_module.  A module
+    that is already imported is returned as is.
+    """
+
+    name = importlib.util.resolve_name(name, package)
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
@@ -1,13 +1,14 @@
+import concurrent.futures
+import functools
 import importlib.metadata
 import importlib.resources
 import json
 import operator
+import os
 import pathlib
-import shutil
-
-from jinja2 import Environment
-
-from . import conversion
+import struct
+import threading
+import zlib
 
 
 DEFAULT_ALIASES = (
@@ -28,7 +29,18 @@ DEFAULT_ALIASES = (
     ('cp_orange', 'cp_seq_red_yellow_ccw'),
     )
 
-JINJA_ENV = Environment(autoescape=False, keep_trailing_newline=True)
+# The magic bytes differ from those of color map archives, which
+# have another layout.
+CMAPS_FILE_MAGIC = b'CPDIST\0\0'
+CMAPS_FILE_VERSION = 1
+
+# The header holds the magic bytes, the version, the number of color
+# maps, and the CRC-32 of the directory.  The directory has an entry
+# for each color map: its name, padded with NULs, the offset of its
+# colors in the file, its number of colors, and their CRC-32.
+CMAPS_FILE_HEADER = struct.Struct('<8sIII')
+CMAPS_FILE_NAME_SIZE = 64
+CMAPS_FILE_ENTRY = struct.Struct(f'<{CMAPS_FILE_NAME_SIZE}sQII')
 
 DISTRIBUTIONS = json.loads(
     (
@@ -40,17 +52,225 @@ DISTRIBUTIONS = json.loads(
 ALL_DISTRIBUTIONS = list(DISTRIBUTIONS.keys())
 
 
+@functools.cache
+def _jinja_env():
+    from jinja2 import Environment
+
+    return Environment(autoescape=False, keep_trailing_newline=True)
+
+
 def collate_cmap_data(cmaps):
     raw_data = b"".join(map(operator.itemgetter(1), cmaps))
     return raw_data
 
 
+def make_cmaps_file(cmaps):
+    """Returns the color maps file of the Python distribution
+
+    The file is a header, a directory of the color maps, and their
+    colors, three bytes each, in the order of the directory and
+    without gaps.  Integers are little-endian.  See
+    CMAPS_FILE_HEADER and CMAPS_FILE_ENTRY for the layout.
+    """
+
+    offset = CMAPS_FILE_HEADER.size + len(cmaps) * CMAPS_FILE_ENTRY.size
+    directory = []
+    for cmap_name, cmap_data in cmaps:
+        encoded_name = cmap_name.encode('utf8')
+        if len(encoded_name) > CMAPS_FILE_NAME_SIZE:
+            raise ValueError(f"Color map name {cmap_name!r} is too long")
+        directory.append(CMAPS_FILE_ENTRY.pack(
+            encoded_name, offset, len(cmap_data) // 3, zlib.crc32(cmap_data),
+            ))
+        offset += len(cmap_data)
+
+    directory = b''.join(directory)
+    header = CMAPS_FILE_HEADER.pack(
+        CMAPS_FILE_MAGIC,
+        CMAPS_FILE_VERSION,
+        len(cmaps),
+        zlib.crc32(directory),
+        )
+    return header + directory + collate_cmap_data(cmaps)
+
+
 def make_cmap_index(cmaps):
     return [
         (cmap_name, len(cmap_data) // 3) for cmap_name, cmap_data in cmaps
         ]
 
 
+def collate_palette_data(raw_cmap_data):
+    """Returns every color as a Bokeh hex string, seven bytes each"""
+
+    hex_data = raw_cmap_data.hex()
+    return ''.join(
+        f'#{hex_data[i:i + 6]}' for i in range(0, len(hex_data), 6)
+        ).encode('ascii')
+
+
+def _rearrangements(name):
+    """Yields the color maps made from the color map name
+
+    Each is described by its name, the number of equal pieces
+    the colors of name are cut into, and a sequence of pairs of a
+    piece and whether it is reversed.
+    """
+
+    yield (name, 1, ((0, False),))
+
+    if name.startswith("cp_seq_"):
+        yield (name + "_r", 1, ((0, True),))
+    elif name.startswith("cp_mseq_"):
+        _, _, *colors = name.split('_')
+
+        num_colors = len(colors)
+        yield (
+            name + "_r",
+            num_colors,
+            tuple((i, True) for i in range(num_colors)),
+            )
+
+        if num_colors == 2:
+            swapped = f"cp_mseq_{colors[1]}_{colors[0]}"
+            yield (f"{name}_hill", 2, ((0, False), (1, True)))
+            yield (f"{name}_valley", 2, ((0, True), (1, False)))
+            yield (swapped, 2, ((1, False), (0, False)))
+            yield (f"{swapped}_r", 2, ((1, True), (0, True)))
+            yield (f"{swapped}_hill", 2, ((1, False), (0, True)))
+            yield (f"{swapped}_valley", 2, ((1, True), (0, False)))
+    elif name.startswith("cp_div_"):
+        _, _, color0, color1, div_type = name.split('_')
+        yield (f"cp_div_{color1}_{color0}_{div_type}", 1, ((0, True),))
+    elif name.startswith("cp_cyc_"):
+        yield (name + "_r", 1, ((0, True),))
+
+        _, _, *all_colors, cyc_type = name.split('_')
+        if cyc_type == 'valley':
+            hill = f"cp_cyc_{'_'.join(all_colors)}_hill"
+            yield (hill, 2, ((1, False), (0, False)))
+            yield (f"{hill}_r", 2, ((0, True), (1, True)))
+
+
+def make_rearrangement_index(cmap_index):
+    """Returns where the colors of every color map are
+
+    This includes reversed and otherwise rearranged color maps.
+    Each color map's colors are given as a tuple of (start, stop,
+    step) ranges of indices into the collated color data.
+    """
+
+    rearrangement_index = []
+    start = 0
+    for cmap_name, cmap_len in cmap_index:
+        for name, num_pieces, pieces in _rearrangements(cmap_name):
+            bounds = [
+                start + i * cmap_len // num_pieces
+                for i in range(num_pieces + 1)
+                ]
+            ranges = tuple(
+                (bounds[i + 1] - 1, bounds[i] - 1, -1) if reverse
+                else (bounds[i], bounds[i + 1], 1)
+                for i, reverse in pieces
+                )
+            rearrangement_index.append((name, ranges))
+        start += cmap_len
+    return rearrangement_index
+
+
+NPY_FILES = (
+    'colors.npy',
+    'lightness.npy',
+    'cmaps.npy',
+    'rearrangements.npy',
+    'rearranged_indices.npy',
+    )
+
+
+def make_npy_files(cmaps, aliases, uniform_space):
+    """Returns the files of a NumPy bundle, by name
+
+    Every file is a .npy file, which can be loaded with
+    numpy.load(path, mmap_mode='r'):
+
+    * colors.npy holds the colors of every color map, stacked, as
+      uint8 sRGB triples.
+
+    * lightness.npy holds the lightness of each color in
+      uniform_space.
+
+    * cmaps.npy gives where each color map is in colors.npy, as
+      records of its name, the offset of its first color, and its
+      number of colors.
+
+    * rearrangements.npy gives every color map by name, including
+      reversed and rearranged color maps and aliases, as records of
+      its name, an offset into rearranged_indices.npy, and its
+      number of colors.  Those entries of rearranged_indices.npy
+      are the indices of its colors in colors.npy.
+    """
+
+    import io
+
+    import numpy as np
+
+    # Only the NumPy bundle needs colour-science, so conversion is
+    # imported here rather than by every cp_make_dist run.
+    from . import conversion
+
+    cmap_index = make_cmap_index(cmaps)
+    colors = np.frombuffer(
+        collate_cmap_data(cmaps), dtype=np.uint8,
+        ).reshape(-1, 3)
+    sRGB_to_uniform = conversion.uniform_space_conversions(uniform_space)[0]
+    lightness = sRGB_to_uniform(conversion.sRGB256_to_sRGB1(colors))[:, 0]
+
+    index_dtype = np.dtype([
+        ('name', f'U{CMAPS_FILE_NAME_SIZE}'),
+        ('offset', '<i8'),
+        ('length', '<i8'),
+        ])
+    offsets = np.cumsum([0] + [length for _, length in cmap_index])
+    cmaps_array = np.array(
+        [
+            (name, offset, length)
+            for (name, length), offset in zip(cmap_index, offsets)
+            ],
+        dtype=index_dtype,
+        )
+
+    rearranged = {
+        name: np.concatenate([np.arange(*r) for r in ranges])
+        for name, ranges in make_rearrangement_index(cmap_index)
+        }
+    for alias, name in aliases:
+        for suffix in ('', '_r'):
+            if name + suffix in rearranged:
+                rearranged[alias + suffix] = rearranged[name + suffix]
+
+    rearrangements = []
+    offset = 0
+    for name, indices in rearranged.items():
+        rearrangements.append((name, offset, len(indices)))
+        offset += len(indices)
+
+    arrays = {
+        'colors.npy': colors,
+        'lightness.npy': lightness.astype('<f8'),
+        'cmaps.npy': cmaps_array,
+        'rearrangements.npy': np.array(rearrangements, dtype=index_dtype),
+        'rearranged_indices.npy': np.concatenate(
+            list(rearranged.values())
+            ).astype('<i8'),
+        }
+    files = {}
+    for filename, array in arrays.items():
+        npy = io.BytesIO()
+        np.save(npy, array, allow_pickle=False)
+        files[filename] = npy.getvalue()
+    return files
+
+
 def _context_version():
     version = importlib.metadata.version(__package__)
     return {
@@ -77,6 +297,15 @@ def _context_py_index(cmap_index):
     return '\n'.join([header] + lines + [footer])
 
 
+def _context_py_rearrangements(rearrangement_index):
+    header = "_REARRANGEMENTS = ("
+    footer = "    )"
+    lines = []
+    for cmap_name, ranges in rearrangement_index:
+        lines.append(f"    ({cmap_name!r}, {ranges!r}),")
+    return '\n'.join([header] + lines + [footer])
+
+
 def _context_py_aliases(aliases):
     lines = []
     lines.append("_ALIASES = (")
@@ -107,8 +336,14 @@ def _context_py_cp_peacock_example(cmaps, aliases):
 def _context_python(cmaps, aliases, cmap_index):
     return {
         'py_data_path': DISTRIBUTIONS['python']['data_path'],
+        'py_palette_path': DISTRIBUTIONS['python']['palette_path'],
         'py_cmaps': _context_py_cmaps(cmap_index),
+        'py_cmaps_file_magic': repr(CMAPS_FILE_MAGIC),
+        'py_cmaps_file_version': repr(CMAPS_FILE_VERSION),
         'py_index': _context_py_index(cmap_index),
+        'py_rearrangements': _context_py_rearrangements(
+            make_rearrangement_index(cmap_index),
+            ),
         'py_aliases': _context_py_aliases(aliases),
         'py_cp_peacock_example': _context_py_cp_peacock_example(
             cmaps, aliases,
@@ -116,12 +351,20 @@ def _context_python(cmaps, aliases, cmap_index):
         }
 
 
+def _context_numpy():
+    return {
+        'npy_directory': DISTRIBUTIONS['numpy']['npy_directory'],
+        'npy_uniform_space': DISTRIBUTIONS['numpy']['uniform_space'],
+        }
+
+
 def prepare_context(cmaps):
     cmap_index = make_cmap_index(cmaps)
 
     context = {}
     context.update(_context_version())
     context.update(_context_python(cmaps, DEFAULT_ALIASES, cmap_index))
+    context.update(_context_numpy())
     return context
 
 
@@ -152,49 +395,189 @@ def find_distribution_files(input_directory, output_directory):
     return files_to_copy, templates_to_render
 
 
-def make_distribution(
+def write_if_changed(path, data):
+    """Writes data to path unless path already holds it
+
+    Unchanged files keep their modification times, so packaging
+    tools and rebuilds only see files that really changed.  Returns
+    whether path was written.
+    """
+
+    path = pathlib.Path(path)
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+
+    temporary_path = path.with_name(
+        f".{path.name}.{os.getpid()}.{threading.get_ident()}"
+        )
+    temporary_path.write_bytes(data)
+    os.replace(temporary_path, path)
+    return True
+
+
+def _render_template(template_path, template_context):
+    template = _jinja_env().from_string(template_path.read_text())
+    return template.render(template_context).encode('utf8')
+
+
+def _make_file(path, contents):
+    if callable(contents):
+        contents = contents()
+    return path, write_if_changed(path, contents)
+
+
+def _call_once(function):
+    """Returns a function that calls function the first time only
+
+    However many threads call it, function is called once, and its
+    result is returned to all of them.
+    """
+
+    lock = threading.Lock()
+    results = []
+
+    def call():
+        with lock:
+            if not results:
+                results.append(function())
+        return results[0]
+
+    return call
+
+
+def _npy_file(npy_files, filename):
+    return npy_files()[filename]
+
+
+def _data_files(name, cmaps):
+    """Returns the data files of a distribution and their contents
+
+    Paths are relative to the distribution.  Contents are bytes or
+    a function returning bytes.
+    """
+
+    configuration = DISTRIBUTIONS[name]
+    files = []
+
+    data_path = configuration.get('data_path')
+    if data_path is not None:
+        files.append((data_path, functools.partial(make_cmaps_file, cmaps)))
+
+    palette_path = configuration.get('palette_path')
+    if palette_path is not None:
+        files.append((
+            palette_path,
+            functools.partial(collate_palette_data, collate_cmap_data(cmaps)),
+            ))
+
+    npy_directory = configuration.get('npy_directory')
+    if npy_directory is not None:
+        # The bundle is made in the first thread to need one of its
+        # files.
+        npy_files = _call_once(functools.partial(
+            make_npy_files,
+            cmaps,
+            DEFAULT_ALIASES,
+            configuration['uniform_space'],
+            ))
+        for filename in NPY_FILES:
+            files.append((
+                pathlib.Path(npy_directory) / filename,
+                functools.partial(_npy_file, npy_files, filename),
+                ))
+
+    return files
+
+
+def _distribution_files(
         name,
         template_context,
-        raw_cmap_data,
+        cmaps,
         input_directory,
         output_directory,
         ):
+    """Returns the path of each file in a distribution and its contents
+
+    Contents are bytes or a function returning bytes.
+    """
+
     files_to_copy, templates_to_render = find_distribution_files(
         input_directory, output_directory,
         )
 
+    files = []
     for template_path, output_path in templates_to_render:
-        template_str = template_path.read_text()
-        template = JINJA_ENV.from_string(template_str)
-        rendered = template.render(template_context)
-        with open(output_path, 'w') as handle:
-            handle.write(rendered)
+        files.append((
+            output_path,
+            functools.partial(
+                _render_template, template_path, template_context,
+                ),
+            ))
 
-    data_path = DISTRIBUTIONS[name].get('data_path')
-    if data_path is not None:
-        with open(output_directory / data_path, 'wb') as handle:
-            handle.write(raw_cmap_data)
+    for path, contents in _data_files(name, cmaps):
+        (output_directory / path).parent.mkdir(parents=True, exist_ok=True)
+        files.append((output_directory / path, contents))
 
     for src_path, dst_path in files_to_copy:
-        shutil.copyfile(src_path, dst_path)
+        files.append((dst_path, src_path.read_bytes))
+
+    return files
+
 
+def _make_files(files, jobs):
+    """Makes files in a pool of threads
+
+    Returns the paths of the files that were written.
+    """
+
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        results = executor.map(lambda file: _make_file(*file), files)
+        return [path for path, written in results if written]
+
+
+def make_distribution(
+        name,
+        template_context,
+        cmaps,
+        input_directory,
+        output_directory,
+        jobs=None,
+        ):
+    """Makes one distribution from the sorted color maps cmaps
+
+    Returns the paths of the files that were written.
+    """
+
+    files = _distribution_files(
+        name, template_context, cmaps, input_directory, output_directory,
+        )
+    return _make_files(files, jobs)
+
+
+def make_distributions(names, all_cmaps, output_directory, jobs=None):
+    """Makes the distributions names from all_cmaps
+
+    The files of every distribution are made concurrently in up to
+    jobs threads.  Files whose contents are unchanged are left
+    alone.  Returns the paths of the files that were written.
+    """
 
-def make_distributions(names, all_cmaps, output_directory):
     dist_directory = (
         importlib.resources.files(__package__) / 'distributions'
         )
 
     all_cmaps = sorted(all_cmaps)
-    raw_cmap_data = collate_cmap_data(all_cmaps)
     template_context = prepare_context(all_cmaps)
+    files = []
     for name in names:
-        current_dist_directory = dist_directory / name
-        current_output_directory = output_directory / name
-
-        make_distribution(
+        files.extend(_distribution_files(
             name,
             template_context,
-            raw_cmap_data,
-            current_dist_directory,
-            current_output_directory,
-            )
+            all_cmaps,
+            dist_directory / name,
+            output_directory / name,
+            ))
+    return _make_files(files, jobs)
@@ -0,0 +1,461 @@
+"""
+Typed color map states
+
+A state describes a color map: its name and type, the data that
+define it (cmap), the parameters of its optimization problem
+(parameters), and options for the optimizer (opt_parameters) and
+for post-processing (post_opt_parameters).  Each section is a
+slotted dataclass with a field for every key the section may
+have, and states are validated when they are made, not whenever
+they are used.
+
+A section remembers which of its fields are present, in order,
+so serializing a state writes exactly the keys that were read.
+Sections and states also support dict-style access, although
+code that runs for every candidate of a search reads fields
+directly.
+
+Angles (hues, hue differences, and sequence data) are in degrees
+in serialized states and in radians during optimization.  A
+state records which unit its angles are in, so converting them
+is idempotent.
+
+Any other keys of a state, such as display options and
+optimization results, are kept in a dict.
+"""
+
+import collections.abc
+import dataclasses
+import functools
+import numbers
+
+import numpy as np
+
+
+DEGREES = 'degrees'
+RADIANS = 'radians'
+
+# Kinds of field values, as written in serialized states.
+REAL = 'real'
+INTEGER = 'integer'
+BOOLEAN = 'boolean'
+STRING = 'string'
+REALS = 'reals'
+
+# A real or an array of reals, one per sequence.
+Reals = float | np.ndarray | None
+
+
+def _is_real(value):
+    return (
+        isinstance(value, (numbers.Real, np.ndarray))
+        and not isinstance(value, (bool, np.bool_))
+        )
+
+
+_KIND_CHECKS = {
+    REAL: _is_real,
+    # Some older states were written with integers as floats.
+    INTEGER: lambda value: (
+        (
+            isinstance(value, numbers.Integral)
+            or (isinstance(value, float) and value.is_integer())
+            )
+        and not isinstance(value, (bool, np.bool_))
+        ),
+    BOOLEAN: lambda value: isinstance(value, (bool, np.bool_)),
+    STRING: lambda value: isinstance(value, str),
+    REALS: lambda value: (
+        _is_real(value)
+        or (
+            isinstance(value, collections.abc.Sequence)
+            and not isinstance(value, str)
+            and all(map(_is_real, value))
+            )
+        ),
+    }
+
+
+# The kinds that values deserialized from JSON always have, which
+# spares most values the general checks.
+_JSON_KINDS = {
+    bool: {BOOLEAN},
+    int: {INTEGER, REAL, REALS},
+    float: {REAL, REALS},
+    str: {STRING},
+    }
+
+
+def _check(value, kind):
+    if value is None or kind in _JSON_KINDS.get(type(value), ()):
+        return True
+    return _KIND_CHECKS[kind](value)
+
+
+def _field(kind, angle=False):
+    return dataclasses.field(metadata={'kind': kind, 'angle': angle})
+
+
+def _coerce(value):
+    value_type = type(value)
+    if value_type in (float, list):
+        return np.array(value)
+    if value_type in (bool, int, str):
+        return value
+    if isinstance(value, (collections.abc.Sequence, float, np.ndarray)):
+        return np.array(value)
+    return value
+
+
+def _copy_value(value):
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    return value
+
+
+def _serialize_value(value):
+    if isinstance(value, np.ndarray):
+        if value.size == 1:
+            return value.item()
+        return (*map(float, value),)
+    return value
+
+
+class Section(collections.abc.MutableMapping):
+    """Base class of the sections of a state
+
+    Subclasses are slotted dataclasses whose fields are the keys
+    the section may have.  Fields that are not present are unset,
+    so reading them as attributes raises AttributeError, as
+    reading them as items raises KeyError.  Setting a field either
+    way makes it present, so it is serialized.
+    """
+
+    __slots__ = ('_keys',)
+
+    def __init__(self, **values):
+        # A dict is an ordered set of the keys that are present.
+        object.__setattr__(self, '_keys', {})
+        for k, v in values.items():
+            self[k] = v
+
+    @classmethod
+    @functools.cache
+    def kinds(cls):
+        return {f.name: f.metadata['kind'] for f in dataclasses.fields(cls)}
+
+    @classmethod
+    @functools.cache
+    def angle_fields(cls):
+        return tuple(
+            f.name for f in dataclasses.fields(cls) if f.metadata['angle']
+            )
+
+    @classmethod
+    def from_dict(cls, data, section_name):
+        """Validates and converts a section of a deserialized state"""
+
+        kinds = cls.kinds()
+        values = {}
+        for k, v in data.items():
+            kind = kinds.get(k)
+            if kind is None:
+                raise ValueError(f"Unknown key {k!r} in {section_name}")
+            if not _check(v, kind):
+                raise ValueError(
+                    f"{section_name} key {k!r} should be {kind}, not {v!r}"
+                    )
+            values[k] = _coerce(v)
+
+        return cls(**values)
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.kinds():
+            raise KeyError(f"{type(self).__name__} has no key {key!r}")
+        object.__setattr__(self, key, value)
+        self._keys[key] = None
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        object.__delattr__(self, key)
+        del self._keys[key]
+
+    def __setattr__(self, name, value):
+        if name not in self.kinds():
+            raise AttributeError(
+                f"{type(self).__name__} has no field {name!r}"
+                )
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self._keys}
+
+    def __setstate__(self, state):
+        Section.__init__(self, **state)
+
+    def __repr__(self):
+        fields = ', '.join(f"{k}={getattr(self, k)!r}" for k in self._keys)
+        return f"{type(self).__name__}({fields})"
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def copy(self):
+        return type(self)(
+            **{k: _copy_value(getattr(self, k)) for k in self._keys}
+            )
+
+    def to_dict(self):
+        return {k: _serialize_value(getattr(self, k)) for k in self._keys}
+
+    def convert_angles(self, func):
+        for k in self.angle_fields():
+            value = self.get(k)
+            if value is not None:
+                self[k] = func(value)
+
+
+@dataclasses.dataclass(slots=True, init=False, repr=False, eq=False)
+class CmapData(Section):
+    """The data defining a color map
+
+    Lightnesses are J' divided by 100, chroma is in the uniform
+    space's units, and sequence data are angles: for cyclic color
+    maps a hue, and otherwise a hue and a hue difference for each
+    sequence.
+    """
+
+    initial_lightness: float | None = _field(REAL)
+    final_lightness: float | None = _field(REAL)
+    chroma: float | None = _field(REAL)
+    sequence_data: Reals = _field(REALS, angle=True)
+    divergence_type: str | None = _field(STRING)
+
+
+@dataclasses.dataclass(slots=True, init=False, repr=False, eq=False)
+class Parameters(Section):
+    """The optimization problem defining a color map
+
+    Hues, hue spans, hue differences, and hue separations are
+    angles.  Lightnesses are as in CmapData.  Fields of type Reals
+    may give a value for each sequence.
+    """
+
+    uniform_space: str | None = _field(STRING)
+    num_samples_per_sequence: int | None = _field(INTEGER)
+    constraint_samples_per_sequence: int | None = _field(INTEGER)
+    Jp_constraint_samples: int | None = _field(INTEGER)
+    allowed_gamut_error: float | None = _field(REAL)
+    cone: bool | None = _field(BOOLEAN)
+    cylinder: bool | None = _field(BOOLEAN)
+
+    center_hue: float | None = _field(REAL, angle=True)
+    span_hue: float | None = _field(REAL, angle=True)
+    center_initial_hue: Reals = _field(REALS, angle=True)
+    span_initial_hue: Reals = _field(REALS, angle=True)
+    center_final_hue: Reals = _field(REALS, angle=True)
+    span_final_hue: Reals = _field(REALS, angle=True)
+    min_hue_diff: Reals = _field(REALS, angle=True)
+    max_hue_diff: Reals = _field(REALS, angle=True)
+    min_initial_hue_separation: float | None = _field(REAL, angle=True)
+    max_initial_hue_separation: float | None = _field(REAL, angle=True)
+    min_final_hue_separation: float | None = _field(REAL, angle=True)
+    max_final_hue_separation: float | None = _field(REAL, angle=True)
+
+    min_initial_lightness: float | None = _field(REAL)
+    max_initial_lightness: float | None = _field(REAL)
+    min_final_lightness: float | None = _field(REAL)
+    max_final_lightness: float | None = _field(REAL)
+    min_lightness_diff: float | None = _field(REAL)
+    max_lightness_diff: float | None = _field(REAL)
+    min_chroma: float | None = _field(REAL)
+    max_chroma: float | None = _field(REAL)
+
+    C_weight: float | None = _field(REAL)
+    Jp_weight: float | None = _field(REAL)
+    weight_chroma: float | None = _field(REAL)
+    weight_initial_lightness: float | None = _field(REAL)
+    weight_final_lightness: float | None = _field(REAL)
+    weight_lightness_diff: float | None = _field(REAL)
+    weight_hue_diff: float | None = _field(REAL)
+    weight_squared_hue_diff: Reals = _field(REALS)
+    weight_hue_initial_separation: float | None = _field(REAL)
+    weight_hue_final_separation: float | None = _field(REAL)
+
+    # No longer used, but present in older states.
+    weight_lightness: float | None = _field(REAL)
+    cone_constraint_samples: int | None = _field(INTEGER)
+    cone_final_samples: int | None = _field(INTEGER)
+
+
+@dataclasses.dataclass(slots=True, init=False, repr=False, eq=False)
+class OptParameters(Section):
+    """Options for the optimizer"""
+
+    maxiter: int | None = _field(INTEGER)
+    tol: float | None = _field(REAL)
+    Jp_constraint_samples: int | None = _field(INTEGER)
+
+
+@dataclasses.dataclass(slots=True, init=False, repr=False, eq=False)
+class PostOptParameters(Section):
+    """Options for post-processing an optimized color map"""
+
+    Jp_final_samples: int | None = _field(INTEGER)
+    reverse: bool | None = _field(BOOLEAN)
+    rotate: int | None = _field(INTEGER)
+    sRGB_approximation_maxiter: int | None = _field(INTEGER)
+    sRGB_approximation_nearby_points: int | None = _field(INTEGER)
+    sRGB_approximation_proof: bool | None = _field(BOOLEAN)
+
+
+SECTIONS = {
+    'cmap': CmapData,
+    'parameters': Parameters,
+    'opt_parameters': OptParameters,
+    'post_opt_parameters': PostOptParameters,
+    }
+
+PERSISTENT_KEYS = ('name', 'type', *SECTIONS)
+
+
+@dataclasses.dataclass(slots=True, eq=False)
+class State(collections.abc.MutableMapping):
+    """A color map state
+
+    The persistent keys are fields.  Other keys are stored in
+    runtime and are never serialized.
+    """
+
+    name: str | None = None
+    type: str | None = None
+    cmap: CmapData = dataclasses.field(default_factory=CmapData)
+    parameters: Parameters = dataclasses.field(default_factory=Parameters)
+    opt_parameters: OptParameters = dataclasses.field(
+        default_factory=OptParameters,
+        )
+    post_opt_parameters: PostOptParameters = dataclasses.field(
+        default_factory=PostOptParameters,
+        )
+    angle_unit: str = DEGREES
+    runtime: dict = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validates and converts a state with angles in degrees
+
+        The persistent keys are required.  Sections are converted
+        to dataclasses, and other keys are copied into runtime.
+        """
+
+        missing = [k for k in PERSISTENT_KEYS if k not in data]
+        if missing:
+            raise ValueError(f"State is missing {', '.join(missing)}")
+        for k in ('name', 'type'):
+            if data[k] is not None and not isinstance(data[k], str):
+                raise ValueError(f"State {k} should be a string")
+
+        return cls(
+            name=data['name'],
+            type=data['type'],
+            **{
+                k: section_cls.from_dict(data[k], k)
+                for k, section_cls in SECTIONS.items()
+                },
+            runtime={
+                k: v for k, v in data.items() if k not in PERSISTENT_KEYS
+                },
+            )
+
+    def __getitem__(self, key):
+        if key in PERSISTENT_KEYS:
+            return getattr(self, key)
+        return self.runtime[key]
+
+    def __setitem__(self, key, value):
+        if key in SECTIONS:
+            if not isinstance(value, Section):
+                value = SECTIONS[key].from_dict(value, key)
+            setattr(self, key, value)
+        elif key in PERSISTENT_KEYS:
+            setattr(self, key, value)
+        else:
+            self.runtime[key] = value
+
+    def __delitem__(self, key):
+        if key in PERSISTENT_KEYS:
+            raise KeyError(f"{key!r} cannot be removed from a state")
+        del self.runtime[key]
+
+    def __contains__(self, key):
+        return key in PERSISTENT_KEYS or key in self.runtime
+
+    def __iter__(self):
+        yield from PERSISTENT_KEYS
+        yield from self.runtime
+
+    def __len__(self):
+        return len(PERSISTENT_KEYS) + len(self.runtime)
+
+    def copy(self):
+        """Returns a copy that can be modified independently
+
+        Sections and their arrays are copied.  Runtime values are
+        shared, as they are replaced rather than modified.
+        """
+
+        return State(
+            name=self.name,
+            type=self.type,
+            **{k: getattr(self, k).copy() for k in SECTIONS},
+            angle_unit=self.angle_unit,
+            runtime=dict(self.runtime),
+            )
+
+    def to_dict(self):
+        """Returns the persistent keys as JSON-compatible values
+
+        Angles are always in degrees.
+        """
+
+        state = self
+        if state.angle_unit != DEGREES:
+            state = self.copy()
+            state.to_degrees()
+
+        return {
+            'name': state.name,
+            'type': state.type,
+            **{k: getattr(state, k).to_dict() for k in SECTIONS},
+            }
+
+    def _convert_angles(self, unit, func):
+        if self.angle_unit == unit:
+            return
+        for k in SECTIONS:
+            getattr(self, k).convert_angles(func)
+        self.angle_unit = unit
+
+    def to_radians(self):
+        self._convert_angles(RADIANS, np.deg2rad)
+
+    def to_degrees(self):
+        self._convert_angles(DEGREES, np.rad2deg)
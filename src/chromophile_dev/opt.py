@@ -3,6 +3,7 @@ Optimization functions
 """
 
 import itertools
+import time
 
 import numpy as np
 import scipy.optimize
@@ -437,16 +438,16 @@ def mseq_objective(parameters):
 
 
 def mseq_opt_setup(state, cmap_func):
-    num_seqs = len(state['cmap']['sequence_data']) // 2
+    num_seqs = len(state.cmap.sequence_data) // 2
 
-    initial = mseq_parse_initial(state['cmap'])
-    objective, hessian = mseq_objective(state['parameters'])
+    initial = mseq_parse_initial(state.cmap)
+    objective, hessian = mseq_objective(state.parameters)
 
-    bounds = mseq_bounds(num_seqs, state['parameters'])
+    bounds = mseq_bounds(num_seqs, state.parameters)
     constraints = [
-        mseq_linear_constraints(num_seqs, state['parameters']),
+        mseq_linear_constraints(num_seqs, state.parameters),
         mseq_sRGB_cmap_constraint(
-            cmap_func, num_seqs, state['parameters'], state['conversions'],
+            cmap_func, num_seqs, state.parameters, state['conversions'],
             ),
         ]
 
@@ -575,15 +576,15 @@ def cyclic_objective(parameters):
 
 
 def cyclic_opt_setup(state, cmap_func):
-    initial = cyclic_parse_initial(state['cmap'])
-    objective, hessian = cyclic_objective(state['parameters'])
+    initial = cyclic_parse_initial(state.cmap)
+    objective, hessian = cyclic_objective(state.parameters)
 
-    bounds = cyclic_bounds(state['parameters'])
+    bounds = cyclic_bounds(state.parameters)
     constraints = [
-        cyclic_linear_constraints(state['parameters']),
+        cyclic_linear_constraints(state.parameters),
         cyclic_sRGB_cmap_constraint(
             cmap_func,
-            state['parameters'],
+            state.parameters,
             state['conversions'],
             ),
         ]
@@ -614,30 +615,39 @@ def optimization_setup(opt_parameters, verbose):
 
 
 def _optimize(opt_args, opt_kwargs, state):
-    if state['verbose_optimize']:
+    runtime = state.runtime
+    if runtime['verbose_optimize']:
         print("Beginning optimization.")
 
+    callback = runtime.get('opt_callback')
+    if callback is not None:
+        opt_kwargs['callback'] = callback
+
+    start_time = time.monotonic()
     result = scipy.optimize.minimize(*opt_args, **opt_kwargs)
+    runtime['opt_time'] = time.monotonic() - start_time
 
-    if state['verbose_optimize'] == 1:
+    if runtime['verbose_optimize'] == 1:
         print(f"Final score: {-result.fun}")
         print(result.message)
-    elif state['verbose_optimize'] > 1:
+    elif runtime['verbose_optimize'] > 1:
         print(result)
 
+    runtime['opt_result'] = result
+
     return result.x
 
 
 def mseq_optimize(state):
-    if state['parameters']['cone']:
-        cmap_func = mseq_cone_cmap_function(state['parameters'])
-    elif state['parameters']['cylinder']:
-        cmap_func = mseq_cylinder_cmap_function(state['parameters'])
+    if state.parameters.cone:
+        cmap_func = mseq_cone_cmap_function(state.parameters)
+    elif state.parameters.cylinder:
+        cmap_func = mseq_cylinder_cmap_function(state.parameters)
     else:
-        cmap_func = mseq_cmap_function(state['parameters'])
+        cmap_func = mseq_cmap_function(state.parameters)
 
     opt_kwargs = optimization_setup(
-        state['opt_parameters'], state['verbose_optimize'],
+        state.opt_parameters, state['verbose_optimize'],
         )
 
     opt_args, opt_mseq_kwargs = mseq_opt_setup(state, cmap_func)
@@ -648,15 +658,15 @@ def mseq_optimize(state):
 
 
 def cyclic_optimize(state):
-    if state['parameters']['cone']:
-        cmap_func = cyclic_cone_cmap_function(state['parameters'])
-    elif state['parameters']['cylinder']:
-        cmap_func = cyclic_cylinder_cmap_function(state['parameters'])
+    if state.parameters.cone:
+        cmap_func = cyclic_cone_cmap_function(state.parameters)
+    elif state.parameters.cylinder:
+        cmap_func = cyclic_cylinder_cmap_function(state.parameters)
     else:
-        cmap_func = cyclic_cmap_function(state['parameters'])
+        cmap_func = cyclic_cmap_function(state.parameters)
 
     opt_kwargs = optimization_setup(
-        state['opt_parameters'], state['verbose_optimize'],
+        state.opt_parameters, state['verbose_optimize'],
         )
 
     opt_args, opt_mseq_kwargs = cyclic_opt_setup(state, cmap_func)
@@ -0,0 +1,201 @@
+"""
+SQLite storage for search results
+"""
+
+import datetime
+import json
+import re
+import sqlite3
+
+import numpy as np
+
+from . import db, search
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY,
+    started TEXT NOT NULL,
+    type TEXT NOT NULL,
+    colorfulness REAL,
+    span REAL,
+    num_samples INTEGER,
+    lightness_threshold REAL,
+    similarity_threshold REAL
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    id INTEGER PRIMARY KEY,
+    search_id INTEGER NOT NULL REFERENCES searches (id),
+    name TEXT NOT NULL,
+    decision TEXT NOT NULL,
+    reason TEXT,
+    sequence_data TEXT,
+    initial_lightness REAL,
+    final_lightness REAL,
+    lightness_difference REAL,
+    chroma REAL,
+    iterations INTEGER,
+    optimize_time REAL,
+    solve_time REAL,
+    warm_start INTEGER,
+    early_stop TEXT,
+    state TEXT
+);
+CREATE INDEX IF NOT EXISTS candidates_search_id
+    ON candidates (search_id);
+"""
+
+SEARCH_COLUMNS = (
+    'started',
+    'type',
+    'colorfulness',
+    'span',
+    'num_samples',
+    'lightness_threshold',
+    'similarity_threshold',
+    )
+
+CANDIDATE_COLUMNS = (
+    'search_id',
+    'name',
+    'decision',
+    'reason',
+    'sequence_data',
+    'initial_lightness',
+    'final_lightness',
+    'lightness_difference',
+    'chroma',
+    'iterations',
+    'optimize_time',
+    'solve_time',
+    'warm_start',
+    'early_stop',
+    'state',
+    )
+
+
+def connect(filename):
+    connection = sqlite3.connect(filename)
+    connection.row_factory = sqlite3.Row
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class ResultStore:
+    """Stores one row per search candidate in an SQLite database
+
+    Each call to _make is a search, recorded in the searches table
+    with the settings it used.  Candidates are buffered and
+    inserted batch_size at a time.  Solved candidates keep their
+    full serialized state, so they can be exported later without
+    optimizing them again.
+    """
+
+    def __init__(self, filename, batch_size=100):
+        self.connection = connect(filename)
+        self.batch_size = batch_size
+        self.search_id = None
+        self.pending = []
+
+    def begin_search(self, settings):
+        self.flush()
+        row = {**settings, 'started': datetime.datetime.now().isoformat()}
+        with self.connection:
+            cursor = self.connection.execute(
+                f"INSERT INTO searches ({', '.join(SEARCH_COLUMNS)})"
+                f" VALUES ({', '.join('?' * len(SEARCH_COLUMNS))})",
+                tuple(row[k] for k in SEARCH_COLUMNS),
+                )
+        self.search_id = cursor.lastrowid
+
+    def add(self, record, state):
+        row = {k: record.get(k) for k in CANDIDATE_COLUMNS}
+        row['search_id'] = self.search_id
+        if row['sequence_data'] is not None:
+            row['sequence_data'] = json.dumps(row['sequence_data'])
+        if row['warm_start'] is not None:
+            row['warm_start'] = int(row['warm_start'])
+        if 'opt_result' in state:
+            row['lightness_difference'] = (
+                record['final_lightness'] - record['initial_lightness']
+                )
+            row['state'] = db.serialize(state)
+
+        self.pending.append(tuple(row[k] for k in CANDIDATE_COLUMNS))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO candidates ({', '.join(CANDIDATE_COLUMNS)})"
+                f" VALUES ({', '.join('?' * len(CANDIDATE_COLUMNS))})",
+                self.pending,
+                )
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def select(
+        connection,
+        search_ids=(),
+        regexp=None,
+        lightness_threshold=None,
+        similarity_threshold=None,
+        ):
+    """Yields stored color maps that pass the search's filters
+
+    Every solved candidate is judged again as _make would judge
+    it, regardless of its original decision.  Candidates whose
+    optimization was stopped early are left out.  Thresholds that are
+    None default to those the search used.  Candidates are
+    considered in the order in which they were found, and
+    similarity is checked within each search, so the original
+    thresholds select the originally accepted color maps.
+    """
+
+    query = "SELECT * FROM searches"
+    if search_ids:
+        query += f" WHERE id IN ({', '.join('?' * len(search_ids))})"
+    query += " ORDER BY id"
+
+    for search_row in connection.execute(query, tuple(search_ids)):
+        search_lightness_threshold = (
+            search_row['lightness_threshold']
+            if lightness_threshold is None
+            else lightness_threshold
+            )
+        search_similarity_threshold = (
+            search_row['similarity_threshold']
+            if similarity_threshold is None
+            else similarity_threshold
+            )
+
+        found_states = []
+        for row in connection.execute(
+                "SELECT name, state FROM candidates"
+                " WHERE search_id = ? AND state IS NOT NULL"
+                " AND decision != 'stopped early' ORDER BY id",
+                (search_row['id'],),
+                ):
+            if regexp is not None and not re.search(regexp, row['name']):
+                continue
+
+            state = db.deserialize(row['state'])
+            rejection = search._assess(
+                state,
+                found_states,
+                search_lightness_threshold,
+                np.array(search_row['colorfulness']),
+                search_similarity_threshold,
+                search.CMAP_FILTERS[state['type']],
+                )
+            if rejection is None:
+                found_states.append(state)
+                yield state
@@ -1,4 +1,7 @@
-import copy
+import concurrent.futures
+import contextlib
+import functools
+import io
 import warnings
 
 import numpy as np
@@ -7,16 +10,22 @@ import matplotlib.pyplot as plt
 from . import cmap, conversion, db, display, fmt, opt
 
 
-# viscm seems to rely on old QT bindings which have been removed
-# in Matplotlib 3.5.
-try:
-    with warnings.catch_warnings():
-        warnings.filterwarnings('ignore')
-        import viscm
-except ImportError:
-    VISCM_AVAILABLE = False
-else:
-    VISCM_AVAILABLE = True
+@functools.cache
+def _viscm():
+    """Returns the viscm module, or None if it is unavailable
+
+    viscm is only imported when a color map is displayed.  It seems
+    to rely on old QT bindings which have been removed in Matplotlib
+    3.5.
+    """
+
+    try:
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore')
+            import viscm
+    except ImportError:
+        return None
+    return viscm
 
 
 def _final_cone_check(state, cmap_cone):
@@ -25,7 +34,7 @@ def _final_cone_check(state, cmap_cone):
 
     cmap_cone_sRGB = state['conversions']['uniform_to_sRGB'](cmap_cone)
 
-    allowed_gamut_error = state['parameters']['allowed_gamut_error']
+    allowed_gamut_error = state.parameters.allowed_gamut_error
 
     sRGB_lower_bound = -allowed_gamut_error
     sRGB_upper_bound = 1. + allowed_gamut_error
@@ -57,24 +66,52 @@ def _final_cone_check(state, cmap_cone):
     print(fmt.colors(*out_of_gamut_colors))
 
 
-def _post_optimization(cmap_uniform, state, old_cmap):
+def _cache_lookup(state):
+    """Returns the cached result for state, or None
+
+    This must be called before state is optimized, since the key
+    is computed from its initial values.
+    """
+
+    result_cache = state.get('cache')
+    if result_cache is None:
+        return None
+
+    state['cache_key'] = result_cache.key(state)
+    cached = result_cache.get(state['cache_key'])
+    if cached is not None and state['verbose_post_process']:
+        print("Using cached color map.")
+    return cached
+
+
+def _post_optimization(cmap_uniform, state, old_cmap, cached=None):
     cmap_uniform = cmap.post_process(
         cmap_uniform,
-        state['post_opt_parameters'],
+        state.post_opt_parameters,
         )
 
-    cmap_sRGB256, cmap_obj = conversion.color_maps_from_uniform(
-        cmap_uniform,
-        state['name'],
-        state['parameters'],
-        state['post_opt_parameters'],
-        state['conversions'],
-        state['verbose_post_process'],
-        )
+    if cached is not None:
+        cmap_sRGB256 = cached['sRGB256']
+        cmap_obj = conversion.sRGB256_to_mpl(
+            cmap_sRGB256.reshape((-1, 3)), name=state.name,
+            )
+    else:
+        cmap_sRGB256, cmap_obj = conversion.color_maps_from_uniform(
+            cmap_uniform,
+            state.name,
+            state.parameters,
+            state.post_opt_parameters,
+            state['conversions'],
+            state['verbose_post_process'],
+            )
+        if state.get('cache') is not None:
+            state['cache'].put(
+                state['cache_key'], state.cmap, cmap_sRGB256,
+                )
 
     if state['verbose_post_process'] and old_cmap is not None:
         had_change = []
-        for k, v in state['cmap'].items():
+        for k, v in state.cmap.items():
             if isinstance(v, (float, np.ndarray)):
                 if not np.all(np.isclose(v, old_cmap[k])):
                     had_change.append(k)
@@ -89,21 +126,32 @@ def _post_optimization(cmap_uniform, state, old_cmap):
                 ", ".join(had_change)
                 )
 
-    db.convert_to_degrees(state)
+    state.to_degrees()
 
     if state['verbose_post_process']:
         print(db.serialize(state))
     if state['output_parameters']:
         db.write_state(state['output_parameters'], state)
     if state['output_color_map']:
-        if state['parameters']['cylinder']:
-            output_path = state['output_color_map']
+        output_path = state['output_color_map']
+        if state.parameters.cylinder:
             dark_path = output_path.with_name(output_path.name + '_dark')
             light_path = output_path.with_name(output_path.name + '_light')
-            db.write_cmap(dark_path, cmap_sRGB256[0])
-            db.write_cmap(light_path, cmap_sRGB256[1])
+            outputs = (
+                (dark_path, cmap_sRGB256[0]),
+                (light_path, cmap_sRGB256[1]),
+                )
         else:
-            db.write_cmap(state['output_color_map'], cmap_sRGB256)
+            outputs = ((output_path, cmap_sRGB256),)
+
+        # With an archive, output paths only supply the names.
+        for path, data in outputs:
+            if state.get('output_archive') is not None:
+                state['output_archive'].add(
+                    path.name, data, state.parameters.uniform_space,
+                    )
+            else:
+                db.write_cmap(path, data)
 
     return cmap_sRGB256, cmap_obj
 
@@ -117,12 +165,12 @@ def _mseq_like_sequence_data(cmap_uniform, cmap_sRGB256, state):
         cmap_sRGB256_idx = cmap_sRGB256[idx]
 
         print(display.mseq_endpoints(
-            state['parameters']['num_samples_per_sequence'],
+            state.parameters.num_samples_per_sequence,
             cmap_uniform_idx,
             cmap_sRGB256_idx,
             ))
         print(display.mseq_lightness_differences(
-            state['parameters']['num_samples_per_sequence'],
+            state.parameters.num_samples_per_sequence,
             cmap_uniform_idx,
             cmap_sRGB256_idx,
             state['conversions'],
@@ -143,8 +191,8 @@ def _cyclic_sequence_data(cmap_uniform, cmap_sRGB256, state):
             ))
 
         if not np.isclose(
-                state['cmap']['initial_lightness'],
-                state['cmap']['final_lightness'],
+                state.cmap.initial_lightness,
+                state.cmap.final_lightness,
                 ):
             print(display.cyclic_lightness_differences(
                 cmap_uniform_idx,
@@ -162,7 +210,7 @@ def _display_cvd(plot_func, cmap_obj, cvd, state):
         cmap_uniform_cvd,
         cmap_sRGB256_cvd,
         cmap_obj_cvd,
-        state['parameters'],
+        state.parameters,
         state['conversions'],
         )
 
@@ -179,7 +227,7 @@ def _display_with_plot_type(
             cmap_uniform,
             cmap_sRGB256,
             cmap_obj,
-            state['parameters'],
+            state.parameters,
             state['conversions'],
             )
 
@@ -188,61 +236,66 @@ def _display_with_plot_type(
             _display_cvd(plot_func, cmap_obj, 'Deuteranomaly', state)
             _display_cvd(plot_func, cmap_obj, 'Tritanomaly', state)
 
-        if VISCM_AVAILABLE:
+        if (viscm := _viscm()) is not None:
             viscm.viscm(cmap_obj)
 
         plt.show()
 
 
 def create_multiseq(state):
-    db.convert_to_radians(state)
+    cached = _cache_lookup(state)
+    state.to_radians()
 
-    old_cmap = copy.deepcopy(state['cmap'])
+    old_cmap = state.cmap.copy()
 
-    if state['optimize']:
+    if cached is not None:
+        state['cmap'] = cached['cmap']
+    elif state['optimize']:
         (
-            state['cmap']['initial_lightness'],
-            state['cmap']['final_lightness'],
-            state['cmap']['chroma'],
-            state['cmap']['sequence_data'],
+            state.cmap.initial_lightness,
+            state.cmap.final_lightness,
+            state.cmap.chroma,
+            state.cmap.sequence_data,
         ) = opt.mseq_optimize(state)
 
-    if state['parameters']['cylinder']:
+    if state.parameters.cylinder:
         cmap_uniform = cmap.cylinder(
-            state['parameters']['num_samples_per_sequence'],
-            state['cmap']['initial_lightness'],
-            state['cmap']['final_lightness'],
-            state['cmap']['chroma'],
-            state['cmap']['sequence_data'][::2],
-            state['cmap']['sequence_data'][1::2],
+            state.parameters.num_samples_per_sequence,
+            state.cmap.initial_lightness,
+            state.cmap.final_lightness,
+            state.cmap.chroma,
+            state.cmap.sequence_data[::2],
+            state.cmap.sequence_data[1::2],
             True,
             2
             )
     else:
         cmap_uniform = cmap.multisequential(
-            state['parameters']['num_samples_per_sequence'],
-            state['cmap']['initial_lightness'],
-            state['cmap']['final_lightness'],
-            state['cmap']['chroma'],
-            state['cmap']['sequence_data'][::2],
-            state['cmap']['sequence_data'][1::2],
+            state.parameters.num_samples_per_sequence,
+            state.cmap.initial_lightness,
+            state.cmap.final_lightness,
+            state.cmap.chroma,
+            state.cmap.sequence_data[::2],
+            state.cmap.sequence_data[1::2],
             True,
             )
 
-    if state['parameters']['cone']:
+    if state.parameters.cone:
         cmap_cone = cmap.cone(
-            state['parameters']['num_samples_per_sequence'],
-            state['cmap']['initial_lightness'],
-            state['cmap']['final_lightness'],
-            state['cmap']['chroma'],
-            state['cmap']['sequence_data'][::2],
-            state['cmap']['sequence_data'][1::2],
+            state.parameters.num_samples_per_sequence,
+            state.cmap.initial_lightness,
+            state.cmap.final_lightness,
+            state.cmap.chroma,
+            state.cmap.sequence_data[::2],
+            state.cmap.sequence_data[1::2],
             True,
-            state['post_opt_parameters']['Jp_final_samples'],
+            state.post_opt_parameters.Jp_final_samples,
             )
         _final_cone_check(state, cmap_cone)
 
-    cmap_sRGB256, cmap_obj = _post_optimization(cmap_uniform, state, old_cmap)
+    cmap_sRGB256, cmap_obj = _post_optimization(
+        cmap_uniform, state, old_cmap, cached,
+        )
 
     _mseq_like_sequence_data(cmap_uniform, cmap_sRGB256, state)
     _display_with_plot_type(
@@ -257,30 +310,35 @@ def create_multiseq(state):
 
 
 def create_divergent(state):
-    db.convert_to_radians(state)
+    cached = _cache_lookup(state)
+    state.to_radians()
 
-    old_cmap = copy.deepcopy(state['cmap'])
+    old_cmap = state.cmap.copy()
 
-    if state['optimize']:
+    if cached is not None:
+        state['cmap'] = cached['cmap']
+    elif state['optimize']:
         (
-            state['cmap']['initial_lightness'],
-            state['cmap']['final_lightness'],
-            state['cmap']['chroma'],
-            state['cmap']['sequence_data'],
+            state.cmap.initial_lightness,
+            state.cmap.final_lightness,
+            state.cmap.chroma,
+            state.cmap.sequence_data,
         ) = opt.mseq_optimize(state)
 
     cmap_uniform = cmap.divergent(
-        state['parameters']['num_samples_per_sequence'],
-        state['cmap']['initial_lightness'],
-        state['cmap']['final_lightness'],
-        state['cmap']['chroma'],
-        state['cmap']['sequence_data'][::2],
-        state['cmap']['sequence_data'][1::2],
+        state.parameters.num_samples_per_sequence,
+        state.cmap.initial_lightness,
+        state.cmap.final_lightness,
+        state.cmap.chroma,
+        state.cmap.sequence_data[::2],
+        state.cmap.sequence_data[1::2],
         True,
-        state['cmap']['divergence_type'],
+        state.cmap.divergence_type,
         )
 
-    cmap_sRGB256, cmap_obj = _post_optimization(cmap_uniform, state, old_cmap)
+    cmap_sRGB256, cmap_obj = _post_optimization(
+        cmap_uniform, state, old_cmap, cached,
+        )
 
     _mseq_like_sequence_data(cmap_uniform, cmap_sRGB256, state)
     _display_with_plot_type(
@@ -295,47 +353,52 @@ def create_divergent(state):
 
 
 def create_cyclic(state):
-    db.convert_to_radians(state)
+    cached = _cache_lookup(state)
+    state.to_radians()
 
-    old_cmap = copy.deepcopy(state['cmap'])
+    old_cmap = state.cmap.copy()
 
-    if state['optimize']:
+    if cached is not None:
+        state['cmap'] = cached['cmap']
+    elif state['optimize']:
         (
-            state['cmap']['initial_lightness'],
-            state['cmap']['final_lightness'],
-            state['cmap']['chroma'],
-            state['cmap']['sequence_data'],
+            state.cmap.initial_lightness,
+            state.cmap.final_lightness,
+            state.cmap.chroma,
+            state.cmap.sequence_data,
         ) = opt.cyclic_optimize(state)
 
-    if state['parameters']['cylinder']:
+    if state.parameters.cylinder:
         cmap_uniform_dark = cmap.cyclic(
-            state['parameters']['num_samples_per_sequence'],
-            state['cmap']['initial_lightness'],
-            state['cmap']['initial_lightness'],
-            state['cmap']['chroma'],
-            state['cmap']['sequence_data'],
+            state.parameters.num_samples_per_sequence,
+            state.cmap.initial_lightness,
+            state.cmap.initial_lightness,
+            state.cmap.chroma,
+            state.cmap.sequence_data,
             )
         cmap_uniform_light = cmap.cyclic(
-            state['parameters']['num_samples_per_sequence'],
-            state['cmap']['final_lightness'],
-            state['cmap']['final_lightness'],
-            state['cmap']['chroma'],
-            state['cmap']['sequence_data'],
+            state.parameters.num_samples_per_sequence,
+            state.cmap.final_lightness,
+            state.cmap.final_lightness,
+            state.cmap.chroma,
+            state.cmap.sequence_data,
             )
         cmap_uniform = np.stack((cmap_uniform_dark, cmap_uniform_light))
     else:
         cmap_uniform = cmap.cyclic(
-            state['parameters']['num_samples_per_sequence'],
-            state['cmap']['initial_lightness'],
-            state['cmap']['final_lightness'],
-            state['cmap']['chroma'],
-            state['cmap']['sequence_data'],
+            state.parameters.num_samples_per_sequence,
+            state.cmap.initial_lightness,
+            state.cmap.final_lightness,
+            state.cmap.chroma,
+            state.cmap.sequence_data,
             )
 
-    cmap_sRGB256, cmap_obj = _post_optimization(cmap_uniform, state, old_cmap)
+    cmap_sRGB256, cmap_obj = _post_optimization(
+        cmap_uniform, state, old_cmap, cached,
+        )
     _cyclic_sequence_data(cmap_uniform, cmap_sRGB256, state)
 
-    if state['parameters']['cylinder']:
+    if state.parameters.cylinder:
         _display_with_plot_type(
             display.cyclic_cylinder_plot,
             cmap_uniform,
@@ -356,13 +419,17 @@ def create_cyclic(state):
 
 
 def create_gray(state):
+    cached = _cache_lookup(state)
+
     cmap_uniform = cmap.gray(
-        state['parameters']['num_samples_per_sequence'],
-        state['cmap']['initial_lightness'],
-        state['cmap']['final_lightness'],
+        state.parameters.num_samples_per_sequence,
+        state.cmap.initial_lightness,
+        state.cmap.final_lightness,
         )
 
-    cmap_sRGB256, cmap_obj = _post_optimization(cmap_uniform, state, None)
+    cmap_sRGB256, cmap_obj = _post_optimization(
+        cmap_uniform, state, None, cached,
+        )
     _mseq_like_sequence_data(cmap_uniform, cmap_sRGB256, state)
 
     _display_with_plot_type(
@@ -374,3 +441,109 @@ def create_gray(state):
         )
 
     return cmap_uniform, cmap_sRGB256, cmap_obj
+
+
+CREATE_FUNCTIONS = {
+    'Multisequential': create_multiseq,
+    'Divergent': create_divergent,
+    'Cyclic': create_cyclic,
+    'Gray': create_gray,
+    }
+
+
+class _CollectedArchive:
+    """Stands in for an archive in a worker process
+
+    Color maps are kept so the parent can add them to the real
+    archive.
+    """
+
+    def __init__(self):
+        self.cmaps = []
+
+    def add(self, name, cmap_sRGB256, uniform_space=None):
+        self.cmaps.append((name, np.array(cmap_sRGB256), uniform_space))
+
+
+def load_nearest_neighbors(spaces):
+    for space in spaces:
+        conversion.sRGB_nearest_neighbors_structure(
+            space, conversion.Conversions(space), False,
+            )
+
+
+def create_buffered(data, runtime):
+    """Makes one color map in a worker process
+
+    data is a serialized state and runtime its runtime keys.  If
+    runtime has an output_archive that is not None, the color maps
+    made are collected instead.  Returns everything that was printed
+    while making it and the color maps it would have added to its
+    archive.
+    """
+
+    state = db.deserialize(data)
+    state.runtime.update(runtime)
+    if state['output_archive'] is not None:
+        state['output_archive'] = _CollectedArchive()
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), \
+            contextlib.redirect_stderr(output):
+        print(f"Processing {state.name}")
+        CREATE_FUNCTIONS[state.type](state)
+
+    output_archive = state['output_archive']
+    cmaps = output_archive.cmaps if output_archive is not None else []
+    return output.getvalue(), cmaps
+
+
+def buffered_jobs(states):
+    """Returns the arguments of create_buffered for each state
+
+    States must not be displayed.  Their output archives are not
+    sent, only whether they have one.
+    """
+
+    jobs_args = []
+    for state in states:
+        runtime = {
+            k: v for k, v in state.runtime.items() if k != 'conversions'
+            }
+        if runtime.get('output_archive') is not None:
+            runtime['output_archive'] = True
+        jobs_args.append((db.serialize(state), runtime))
+    return jobs_args
+
+
+def create_in_parallel(states, jobs):
+    """Makes color maps in a pool of jobs processes
+
+    Yields, in the order of states, everything that was printed
+    while making each color map and the color maps to add to its
+    archive, as for buffered_jobs.
+
+    The sRGB nearest neighbors structures are loaded before the
+    pool starts, so that forked workers share them, and otherwise
+    each worker loads them once.
+    """
+
+    states = list(states)
+    spaces = sorted({state.parameters.uniform_space for state in states})
+    load_nearest_neighbors(spaces)
+    jobs_args = buffered_jobs(states)
+
+    with concurrent.futures.ProcessPoolExecutor(
+            jobs,
+            initializer=load_nearest_neighbors,
+            initargs=(spaces,),
+            ) as executor:
+        futures = [
+            executor.submit(create_buffered, *args) for args in jobs_args
+            ]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
@@ -1,11 +1,15 @@
-import copy
+import collections
+import datetime
 import functools
+import heapq
+import json
 import itertools
 import operator
+import time
 
 import numpy as np
 
-from . import db, run
+from . import conversion, db, opt, run
 
 
 SHARED_PARAMETERS = {
@@ -334,6 +338,519 @@ def marked_arcs(step):
             yield (lb, mark, ub)
 
 
+WARM_START_KEYS = ('initial_lightness', 'final_lightness', 'chroma')
+
+
+def _nearest_solution(grid_point, solved_points, solved_cmaps):
+    """Returns the solved color map closest to grid_point
+
+    Distances are measured between the sequence data with which
+    each candidate began, using the largest coordinate difference.
+    Returns None if nothing has been solved yet.
+    """
+
+    if not solved_points:
+        return None
+
+    distances = np.max(
+        np.abs(np.array(solved_points) - grid_point).reshape(
+            len(solved_points), -1,
+            ),
+        axis=1,
+        )
+    return solved_cmaps[np.argmin(distances)]
+
+
+def _warm_start(state, solved_cmap):
+    """Seed the optimizer with a neighboring candidate's solution
+
+    The seed is clipped to the bounds of the current candidate so
+    that the optimizer starts from a point it accepts.
+    """
+
+    parameters = state.parameters
+    for k in WARM_START_KEYS:
+        state.cmap[k] = np.clip(
+            solved_cmap[k],
+            parameters[f'min_{k}'],
+            parameters[f'max_{k}'],
+            )
+
+
+# Relative change in the objective below which an optimization is
+# considered to have stalled.
+STALL_TOLERANCE = 1e-10
+
+
+def _early_stop_callback(state, lightness_threshold, stall_iterations):
+    """Returns a trust-constr callback that abandons unpromising solves
+
+    Once an iterate is feasible, the callback stops the solve if
+    the lightness difference seems unable to reach
+    lightness_threshold, or if the objective has not changed for
+    stall_iterations iterations.  The reason for stopping is
+    recorded in state['early_stop'].
+
+    The first test is a heuristic.  For the barrier problems
+    solved by trust-constr, a feasible iterate's objective is
+    within about (number of constraints) * (barrier parameter) of
+    optimal, and that gap is taken as how much the lightness
+    difference can still grow.  The gap bounds the whole weighted
+    objective, not the lightness difference, so a candidate
+    stopped this way is not known to fail the threshold.  _make
+    records it as stopped early rather than rejected.
+    """
+
+    feasibility_tolerance = state.parameters.allowed_gamut_error
+    recent_scores = collections.deque(maxlen=stall_iterations)
+
+    def callback(x, opt_state):
+        if opt_state.constr_violation > feasibility_tolerance:
+            recent_scores.clear()
+            return False
+
+        num_constraints = 2 * sum(map(np.size, opt_state.constr))
+        remaining = num_constraints * getattr(
+            opt_state, 'barrier_parameter', 0.0,
+            )
+        if x[1] - x[0] + remaining < lightness_threshold:
+            state['early_stop'] = 'hopeless'
+            return True
+
+        recent_scores.append(opt_state.fun)
+        if (
+                len(recent_scores) == stall_iterations
+                and max(recent_scores) - min(recent_scores)
+                <= STALL_TOLERANCE * (1.0 + abs(opt_state.fun))
+                ):
+            state['early_stop'] = 'stalled'
+            return True
+
+        return False
+
+    return callback
+
+
+def _json_value(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class SearchLog:
+    """Collects the outcome of every candidate considered by a search
+
+    Each candidate produces one record, a dict holding its name, a
+    decision ('accepted', 'rejected', 'stopped early', 'skipped', or
+    'not attempted'), a short reason, and whatever optimization
+    details are known.  The records are tallied into a progress
+    report that is printed every progress_interval seconds, and
+    all but the skipped candidates are written as JSON lines to
+    records_file if one is given and added to store, a
+    results.ResultStore, if one is given.  Messages about
+    individual candidates are only printed if verbose is positive.
+
+    A single log may be shared by several calls to _make, as in
+    make_div.  Call finish when the search is done.
+    """
+
+    def __init__(
+            self,
+            verbose=0,
+            progress_interval=10.0,
+            records_file=None,
+            store=None,
+            ):
+        self.verbose = verbose
+        self.progress_interval = progress_interval
+        self.records_file = records_file
+        self.store = store
+        self.start_time = time.monotonic()
+        self.last_report_time = self.start_time
+        self.num_candidates = 0
+        self.num_processed = 0
+        self.counts = collections.Counter()
+        self.optimize_times = []
+        self.iterations = {False: [], True: []}
+        self.early_stops = collections.Counter()
+        self.not_attempted = []
+        self.searches = []
+
+    def message(self, *args):
+        if self.verbose > 0:
+            print(*args)
+
+    def begin(self, num_candidates, settings):
+        """Announces a pass over num_candidates candidates
+
+        settings describes the search: the color map type, the
+        search grid, the total number of candidates in the grid,
+        and the thresholds used to judge candidates.
+        """
+
+        self.num_candidates += num_candidates
+        self.searches.append(settings)
+        if self.store is not None:
+            self.store.begin_search(
+                {k: _json_value(v) for k, v in settings.items()}
+                )
+
+    def record(self, state, decision, reason=None, message=None, **fields):
+        if message is not None:
+            self.message(message)
+
+        record = {
+            'name': state.name,
+            'decision': decision,
+            'reason': reason,
+            **fields,
+            }
+        if state.cmap.get('sequence_data') is not None:
+            record['sequence_data'] = state.cmap.sequence_data
+        if 'opt_result' in state:
+            record['iterations'] = state['opt_result'].nit
+            record['optimize_time'] = state['opt_time']
+            for k in WARM_START_KEYS:
+                record[k] = state.cmap[k]
+            self.optimize_times.append(state['opt_time'])
+            self.iterations[fields.get('warm_start', False)].append(
+                record['iterations']
+                )
+        if (early_stop := state.get('early_stop')) is not None:
+            record['early_stop'] = early_stop
+            self.early_stops[early_stop] += 1
+        record = {k: _json_value(v) for k, v in record.items()}
+
+        self.counts[decision, reason] += 1
+        self.num_processed += 1
+        if decision == 'not attempted':
+            self.not_attempted.append(record)
+        if decision != 'skipped':
+            if self.records_file is not None:
+                self.records_file.write(json.dumps(record) + "\n")
+            if self.store is not None:
+                self.store.add(record, state)
+
+        if time.monotonic() - self.last_report_time >= self.progress_interval:
+            self.report()
+
+    def report(self):
+        now = time.monotonic()
+        elapsed = now - self.start_time
+        rate = self.num_processed / elapsed if elapsed > 0 else 0.0
+
+        parts = [
+            f"{self.num_processed}/{self.num_candidates} candidates",
+            f"{60 * rate:.1f}/min",
+            ]
+        for decision in (
+                'accepted',
+                'rejected',
+                'stopped early',
+                'skipped',
+                'not attempted',
+                ):
+            reasons = sorted(
+                (reason, count)
+                for (d, reason), count in self.counts.items()
+                if d == decision and reason is not None
+                )
+            total = sum(
+                count
+                for (d, _), count in self.counts.items()
+                if d == decision
+                )
+            if total == 0:
+                continue
+            part = f"{decision} {total}"
+            if reasons:
+                part += " (" + ", ".join(
+                    f"{reason} {count}" for reason, count in reasons
+                    ) + ")"
+            parts.append(part)
+        if self.optimize_times:
+            parts.append(
+                f"mean optimize time {np.mean(self.optimize_times):.2f} s"
+                )
+        remaining = self.num_candidates - self.num_processed
+        if remaining > 0 and rate > 0:
+            eta = datetime.timedelta(seconds=round(remaining / rate))
+            parts.append(f"ETA {eta}")
+
+        print("Progress: " + "; ".join(parts))
+        self.last_report_time = now
+        if self.records_file is not None:
+            self.records_file.flush()
+        if self.store is not None:
+            self.store.flush()
+
+    def finish(self):
+        self.report()
+        for warm, label in ((False, "cold"), (True, "warm")):
+            counts = self.iterations[warm]
+            if not counts:
+                continue
+            print(
+                f"Mean optimizer iterations over {len(counts)} {label}"
+                f" starts: {np.mean(counts):.1f}"
+                )
+        for reason, count in sorted(self.early_stops.items()):
+            print(f"Optimizations stopped early ({reason}): {count}")
+        if self.not_attempted:
+            print(
+                "Deadline reached before attempting"
+                f" {len(self.not_attempted)} candidates."
+                )
+
+
+def _setup_candidate(
+        initial_state,
+        make_name,
+        i,
+        cmap_data,
+        cmap_setup_fn,
+        log,
+        ):
+    """Returns the state of a candidate, or None if it fails cmap_setup_fn
+
+    Candidates that fail are logged.
+    """
+
+    state = initial_state.copy()
+    state.name = make_name(i, cmap_data)
+    if cmap_setup_fn(state, cmap_data):
+        return state
+    if 'rejection' in state:
+        log.record(state, 'rejected', *state['rejection'])
+    else:
+        log.record(state, 'skipped')
+    return None
+
+
+def _setup_candidates(
+        initial_state,
+        make_name,
+        indexed_cmap_data,
+        cmap_setup_fn,
+        deadline,
+        log,
+        ):
+    """Yields a state for each candidate that passes cmap_setup_fn
+
+    indexed_cmap_data yields pairs of a candidate's index and its
+    data.  Candidates reached after the deadline are not set up
+    and are logged as not attempted instead.
+    """
+
+    for i, cmap_data in indexed_cmap_data:
+        if deadline is not None and time.monotonic() >= deadline:
+            state = initial_state.copy()
+            state.name = make_name(i, cmap_data)
+            log.record(state, 'not attempted', 'deadline')
+            continue
+
+        state = _setup_candidate(
+            initial_state, make_name, i, cmap_data, cmap_setup_fn, log,
+            )
+        if state is not None:
+            yield state
+
+
+def _feasible_lightness_range(state, hues, num_lightness_samples=101):
+    """Estimates the lightnesses at which hues are in gamut
+
+    Returns the smallest and largest lightness at which every hue
+    in hues (in degrees) is in the sRGB gamut at the state's
+    chroma.  If some hue is never in gamut, the range is empty.
+    """
+
+    lightnesses = np.linspace(0.0, 1.0, num_lightness_samples)
+    hues = np.deg2rad(np.ravel(hues))
+    chroma = state.cmap.chroma
+
+    samples = np.stack(
+        np.broadcast_arrays(
+            lightnesses[:, None],
+            chroma * np.cos(hues)[None, :],
+            chroma * np.sin(hues)[None, :],
+            ),
+        axis=-1,
+        )
+    valid = conversion.sRGB1_validity(
+        state['conversions']['uniform_to_sRGB'](samples)
+        )
+
+    lower = -np.inf
+    upper = np.inf
+    for hue_valid in valid.T:
+        if not np.any(hue_valid):
+            return np.inf, -np.inf
+        valid_lightnesses = lightnesses[hue_valid]
+        lower = max(lower, valid_lightnesses[0])
+        upper = min(upper, valid_lightnesses[-1])
+
+    return lower, upper
+
+
+def _lightness_difference_estimate(state):
+    """Cheaply estimates the lightness difference a candidate can reach
+
+    Every initial hue must be in gamut at the initial lightness,
+    and every final hue must be in gamut at the final lightness.
+    This ignores the optimizer's freedom to move the hues.
+    """
+
+    sequence_data = np.ravel(state.cmap.sequence_data)
+    if state.type == 'Cyclic':
+        initial_hues = sequence_data
+        final_hues = sequence_data + 180.0
+    else:
+        initial_hues = sequence_data[::2]
+        final_hues = initial_hues + sequence_data[1::2]
+
+    initial_lightness, _ = _feasible_lightness_range(state, initial_hues)
+    _, final_lightness = _feasible_lightness_range(state, final_hues)
+
+    parameters = state.parameters
+    initial_lightness = max(
+        initial_lightness, parameters['min_initial_lightness'],
+        )
+    final_lightness = min(final_lightness, parameters['max_final_lightness'])
+
+    return final_lightness - initial_lightness
+
+
+def _best_first(
+        initial_state,
+        make_name,
+        indexed_cmap_data,
+        cmap_setup_fn,
+        rank_setup_fn,
+        deadline,
+        log,
+        ):
+    """Yields candidates in order of estimated promise until the deadline
+
+    Candidates are ranked by _lightness_difference_estimate.  To
+    rank a candidate, rank_setup_fn, which must be cheap and must
+    fail whenever cmap_setup_fn would, sets it up in a scratch
+    state shared by every candidate.  A candidate is only copied
+    and set up by cmap_setup_fn when it leaves the queue, so
+    expensive setups, like pruning, are only done for candidates
+    that are attempted.  Ranking stops when half of the remaining
+    time is spent, so that some of the time is left for attempting
+    candidates.  Candidates that are not ranked or are left when
+    the deadline passes are logged as not attempted.
+    """
+
+    start_time = time.monotonic()
+    rank_deadline = start_time + (deadline - start_time) / 2
+    scratch = initial_state.copy()
+
+    def rank_setup(i, cmap_data):
+        scratch['name'] = make_name(i, cmap_data)
+        if rank_setup_fn(scratch, cmap_data):
+            return True
+        if 'rejection' in scratch:
+            log.record(scratch, 'rejected', *scratch['rejection'])
+            del scratch['rejection']
+        else:
+            log.record(scratch, 'skipped')
+        return False
+
+    queue = []
+    for i, cmap_data in indexed_cmap_data:
+        if not rank_setup(i, cmap_data):
+            continue
+        if time.monotonic() >= rank_deadline:
+            log.record(scratch, 'not attempted', 'deadline')
+            continue
+        estimate = _lightness_difference_estimate(scratch)
+        heapq.heappush(queue, (-estimate, i, cmap_data))
+
+    log.message(f"Ranked {len(queue)} candidates.")
+
+    while queue:
+        negative_estimate, i, cmap_data = heapq.heappop(queue)
+        if time.monotonic() >= deadline:
+            rank_setup(i, cmap_data)
+            log.record(
+                scratch,
+                'not attempted',
+                'deadline',
+                lightness_difference_estimate=-negative_estimate,
+                )
+            continue
+
+        state = _setup_candidate(
+            initial_state, make_name, i, cmap_data, cmap_setup_fn, log,
+            )
+        if state is not None:
+            yield state
+
+
+def _assess(
+        state,
+        found_states,
+        lightness_threshold,
+        colorfulness,
+        similarity_threshold,
+        cmap_filter_fn,
+        ):
+    """Decides whether a solved candidate should be accepted
+
+    Returns None if it should.  Otherwise returns the reason for
+    rejecting it, a message describing the rejection, and a dict
+    of extra fields for the candidate's record.
+    """
+
+    if not cmap_filter_fn(state, similarity_threshold):
+        return (*state['rejection'], {})
+
+    lightness_diff = (
+        state.cmap.final_lightness
+        - state.cmap.initial_lightness
+        )
+    if lightness_diff < lightness_threshold:
+        return (
+            'lightness difference',
+            "Rejecting due to size of lightness difference.",
+            {},
+            )
+
+    # One way in which optimization can fail is by producing
+    # a color map where the chroma is wrong.  We reject the
+    # color map if the chroma differs from the target by more
+    # than 5%.
+    if abs(state.cmap.chroma / colorfulness - 1.0) > 0.05:
+        return (
+            'colorfulness',
+            f"Rejecting due to colorfulness of {state.cmap.chroma}",
+            {},
+            )
+
+    # Reject results that are too close to other found states
+    for s in found_states:
+        if np.all(
+                np.abs(
+                    s['cmap']['sequence_data']
+                    - state.cmap.sequence_data
+                    )
+                < similarity_threshold
+                ):
+            return (
+                'similar to accepted',
+                f"Rejecting because {state.cmap.sequence_data}"
+                f" is too similar to {s['cmap']['sequence_data']}"
+                f" from {s['name']}",
+                {'similar_to': s['name']},
+                )
+
+    return None
+
+
 def _make(
         initial_parameters,
         colorfulness,
@@ -345,9 +862,20 @@ def _make(
         cmap_setup_fn,
         cmap_creation_fn,
         cmap_filter_fn,
+        *,
+        warm_start=False,
+        early_stop=False,
+        stall_iterations=50,
+        deadline=None,
+        candidate_range=None,
+        log=None,
+        rank_setup_fn=None,
         ):
-    initial_state = copy.deepcopy(initial_parameters)
-    db.initialize_state(initial_state)
+    finish_log = log is None
+    if log is None:
+        log = SearchLog(verbose=1)
+
+    initial_state = db.initialize_state(initial_parameters)
 
     colorfulness = np.array(colorfulness)
     span = np.array(span)
@@ -355,67 +883,130 @@ def _make(
     make_name, cmap_iter = initial_setup_fn(
         initial_state, colorfulness, span, num_samples,
         )
+    # The grid is counted from a second enumeration of it, so that
+    # it is never held in memory.  Candidates keep their index in
+    # the full grid, and hence their name, when only a range of
+    # them is searched.
+    _, counted_cmap_iter = initial_setup_fn(
+        initial_state.copy(), colorfulness, span, num_samples,
+        )
+    num_candidates = sum(1 for _ in counted_cmap_iter)
+    indices = range(num_candidates)
+    if candidate_range is not None:
+        indices = indices[slice(*candidate_range)]
+    log.begin(
+        len(indices),
+        {
+            'type': initial_state.type,
+            'num_candidates': num_candidates,
+            'colorfulness': colorfulness,
+            'span': span,
+            'num_samples': num_samples,
+            'lightness_threshold': lightness_threshold,
+            'similarity_threshold': similarity_threshold,
+            },
+        )
 
-    found_states = []
-    for i, cmap_data in enumerate(cmap_iter):
-        current_state = copy.deepcopy(initial_state)
-        current_state['name'] = make_name(i, cmap_data)
+    # Neighboring candidates often have similar optimal
+    # lightnesses and chroma, so when warm starting, each
+    # candidate begins from the solution of the closest candidate
+    # solved so far.
+    solved_points = []
+    solved_cmaps = []
+
+    # With a deadline, the most promising candidates are attempted
+    # first so that an interrupted search has spent its time well.
+    indexed_cmap_data = itertools.islice(
+        enumerate(cmap_iter), indices.start, indices.stop, indices.step,
+        )
+    if deadline is None:
+        candidates = _setup_candidates(
+            initial_state,
+            make_name,
+            indexed_cmap_data,
+            cmap_setup_fn,
+            deadline,
+            log,
+            )
+    else:
+        candidates = _best_first(
+            initial_state,
+            make_name,
+            indexed_cmap_data,
+            cmap_setup_fn,
+            rank_setup_fn or cmap_setup_fn,
+            deadline,
+            log,
+            )
 
-        print(f"Considering {current_state['name']}")
+    found_states = []
+    for current_state in candidates:
+        log.message(f"Considering {current_state.name}")
+
+        grid_point = np.array(current_state.cmap.sequence_data)
+        solved_cmap = None
+        if warm_start:
+            solved_cmap = _nearest_solution(
+                grid_point, solved_points, solved_cmaps,
+                )
+            if solved_cmap is not None:
+                _warm_start(current_state, solved_cmap)
 
-        if not cmap_setup_fn(current_state, cmap_data):
-            continue
+        if early_stop:
+            current_state['opt_callback'] = _early_stop_callback(
+                current_state, lightness_threshold, stall_iterations,
+                )
 
+        start_time = time.monotonic()
         cmap_creation_fn(current_state)
+        record = functools.partial(
+            log.record,
+            current_state,
+            solve_time=time.monotonic() - start_time,
+            warm_start=solved_cmap is not None,
+            )
 
-        if not cmap_filter_fn(current_state, similarity_threshold):
+        if (reason := current_state.get('early_stop')) is not None:
+            log.message(f"Stopped optimization early ({reason}).")
+        if reason == 'hopeless':
+            # The solve is unfinished, so it is neither judged nor
+            # used to warm start other candidates.
+            record('stopped early', reason)
             continue
 
+        solved_points.append(grid_point)
+        solved_cmaps.append(
+            {k: current_state.cmap[k] for k in WARM_START_KEYS}
+            )
+
         lightness_diff = (
-            current_state['cmap']['final_lightness']
-            - current_state['cmap']['initial_lightness']
+            current_state.cmap.final_lightness
+            - current_state.cmap.initial_lightness
             )
+        log.message(f"Lightness difference is {lightness_diff}.")
 
-        print(f"Lightness difference is {lightness_diff}.")
-        if lightness_diff < lightness_threshold:
-            print("Rejecting due to size of lightness difference.")
+        rejection = _assess(
+            current_state,
+            found_states,
+            lightness_threshold,
+            colorfulness,
+            similarity_threshold,
+            cmap_filter_fn,
+            )
+        if rejection is not None:
+            reason, message, fields = rejection
+            record('rejected', reason, message, **fields)
             continue
 
-        # One way in which optimization can fail is by producing
-        # a color map where the chroma is wrong.  We reject the
-        # color map if the chroma differs from the target by more
-        # than 5%.
-        if abs(current_state['cmap']['chroma'] / colorfulness - 1.0) > 0.05:
-            print(
-                "Rejecting due to colorfulness of"
-                f" {current_state['cmap']['chroma']}"
-                )
-            continue
+        log.message(
+            "Accepting.  Sequence data is:",
+            current_state.cmap.sequence_data,
+            )
+        record('accepted')
+        found_states.append(current_state)
 
-        # Reject results that are too close to other found states
-        for s in found_states:
-            if np.all(
-                    np.abs(
-                        s['cmap']['sequence_data']
-                        - current_state['cmap']['sequence_data']
-                        )
-                    < similarity_threshold
-                    ):
-                print(
-                    "Rejecting because",
-                    current_state['cmap']['sequence_data'],
-                    "is too similar to",
-                    s['cmap']['sequence_data'],
-                    " from",
-                    s['name'],
-                    )
-                break
-        else:
-            print(
-                "Accepting.  Sequence data is:",
-                current_state['cmap']['sequence_data'],
-                )
-            found_states.append(current_state)
+    if finish_log:
+        log.finish()
 
     return found_states
 
@@ -428,11 +1019,11 @@ def _mseq_initial_setup(
         num_seqs,
         num_extra_revolutions,
         ):
-    state['cmap']['chroma'] = colorfulness
-    state['parameters']['min_chroma'] = colorfulness
-    state['parameters']['max_chroma'] = colorfulness
-    state['parameters']['span_initial_hue'] = span / 2
-    state['parameters']['span_final_hue'] = span / 2
+    state.cmap['chroma'] = colorfulness
+    state.parameters['min_chroma'] = colorfulness
+    state.parameters['max_chroma'] = colorfulness
+    state.parameters['span_initial_hue'] = span / 2
+    state.parameters['span_final_hue'] = span / 2
 
     if num_seqs == 1:
         base_name = "cp_seq"
@@ -465,16 +1056,16 @@ def _mseq_cmap_setup(state, arcs, max_arc_length, min_arc_length):
             ):
         return False
 
-    state['cmap']['sequence_data'] = np.fromiter(
+    state.cmap['sequence_data'] = np.fromiter(
         itertools.chain.from_iterable(arcs),
         dtype=np.float64,
         )
-    state['parameters']['center_initial_hue'] = np.fromiter(
+    state.parameters['center_initial_hue'] = np.fromiter(
         map(operator.itemgetter(0), arcs),
         dtype=np.float64,
         )
-    state['parameters']['center_final_hue'] = (
-        state['parameters']['center_initial_hue']
+    state.parameters['center_final_hue'] = (
+        state.parameters.center_initial_hue
         + hue_diffs
         )
 
@@ -482,14 +1073,82 @@ def _mseq_cmap_setup(state, arcs, max_arc_length, min_arc_length):
 
 
 def _mseq_cmap_filter(state, similarity_threshold):
-    seqs = state['cmap']['sequence_data'].reshape(-1, 2)
+    seqs = state.cmap.sequence_data.reshape(-1, 2)
     for seq0, seq1 in itertools.combinations(seqs, 2):
         if np.all(np.abs(seq0 - seq1) < similarity_threshold):
-            print(f"Rejecting because {seq0} and {seq1} are too similar.")
+            state['rejection'] = (
+                'similar sequences',
+                f"Rejecting because {seq0} and {seq1} are too similar.",
+                )
             return False
     return True
 
 
+def _single_arc_state(colorfulness, span, num_samples):
+    state = db.initialize_state(SEQUENTIAL_PARAMETERS)
+    _mseq_initial_setup(
+        state, np.array(colorfulness), np.array(span), num_samples, 1, 0,
+        )
+    return state
+
+
+def _arc_lightness_range(arc_state, arc, memo):
+    """Returns the optimal lightness range of a single directed arc
+
+    Results are memoized in memo, which is keyed by arc.
+    """
+
+    if arc not in memo:
+        state = arc_state.copy()
+        _mseq_cmap_setup(state, (arc,), np.inf, -np.inf)
+        state.to_radians()
+        initial_lightness, final_lightness, _, _ = opt.mseq_optimize(state)
+        memo[arc] = (initial_lightness, final_lightness)
+
+    return memo[arc]
+
+
+def _mseq_pruned_cmap_setup(
+        state,
+        arcs,
+        cmap_setup_fn,
+        arc_state,
+        memo,
+        lightness_threshold,
+        pruned,
+        ):
+    """Skip combinations of arcs that cannot be light enough
+
+    Every sequence in a multisequential color map shares the same
+    initial and final lightness, so the color map's lightness
+    range must lie within the range each of its arcs can achieve
+    on its own.  We approximate the latter by the optimal range
+    of each arc and reject the combination if the intersection of
+    these ranges is shorter than lightness_threshold.  In
+    particular, no combination containing an arc that fails the
+    threshold on its own is ever optimized.
+    """
+
+    if not cmap_setup_fn(state, arcs):
+        return False
+
+    ranges = [_arc_lightness_range(arc_state, arc, memo) for arc in arcs]
+    lightness_bound = (
+        min(final for _, final in ranges)
+        - max(initial for initial, _ in ranges)
+        )
+    if lightness_bound < lightness_threshold:
+        state['rejection'] = (
+            'pruned',
+            f"Pruning {state.name} because its arcs allow a lightness"
+            f" difference of at most {lightness_bound}.",
+            )
+        pruned.append(state.name)
+        return False
+
+    return True
+
+
 def make_mseq(
         num_samples,
         span,
@@ -500,8 +1159,33 @@ def make_mseq(
         max_arc_length,
         min_arc_length,
         num_extra_revolutions,
+        prune_arcs=False,
+        **search_options,
         ):
-    return _make(
+    cmap_setup_fn = rank_setup_fn = functools.partial(
+        _mseq_cmap_setup,
+        max_arc_length=max_arc_length,
+        min_arc_length=min_arc_length,
+        )
+
+    # Single-arc problems are solved on first use and remembered,
+    # so each arc is optimized once no matter how many
+    # combinations it appears in.  With a deadline, candidates are
+    # ranked without pruning, so arcs are only solved for
+    # candidates that are attempted.
+    memo = {}
+    pruned = []
+    if prune_arcs and num_seqs > 1:
+        cmap_setup_fn = functools.partial(
+            _mseq_pruned_cmap_setup,
+            cmap_setup_fn=cmap_setup_fn,
+            arc_state=_single_arc_state(colorfulness, span, num_samples),
+            memo=memo,
+            lightness_threshold=lightness_threshold,
+            pruned=pruned,
+            )
+
+    found_states = _make(
         SEQUENTIAL_PARAMETERS,
         colorfulness,
         span,
@@ -513,15 +1197,21 @@ def make_mseq(
             num_seqs=num_seqs,
             num_extra_revolutions=num_extra_revolutions,
             ),
-        functools.partial(
-            _mseq_cmap_setup,
-            max_arc_length=max_arc_length,
-            min_arc_length=min_arc_length,
-            ),
+        cmap_setup_fn,
         run.create_multiseq,
         _mseq_cmap_filter,
+        rank_setup_fn=rank_setup_fn,
+        **search_options,
         )
 
+    if memo:
+        print(
+            f"Solved {len(memo)} single arcs and pruned"
+            f" {len(pruned)} combinations."
+            )
+
+    return found_states
+
 
 def _div_initial_setup(
         state,
@@ -530,18 +1220,18 @@ def _div_initial_setup(
         num_samples,
         div_type,
         ):
-    state['cmap']['chroma'] = colorfulness
-    state['parameters']['min_chroma'] = colorfulness
-    state['parameters']['max_chroma'] = colorfulness
-    state['parameters']['span_initial_hue'] = span / 2
-    state['parameters']['span_final_hue'] = span / 2
+    state.cmap['chroma'] = colorfulness
+    state.parameters['min_chroma'] = colorfulness
+    state.parameters['max_chroma'] = colorfulness
+    state.parameters['span_initial_hue'] = span / 2
+    state.parameters['span_final_hue'] = span / 2
 
     if div_type == 'hill':
-        state['parameters']['min_final_hue_separation'] = 0.0
-        state['parameters']['max_final_hue_separation'] = 0.0
+        state.parameters['min_final_hue_separation'] = 0.0
+        state.parameters['max_final_hue_separation'] = 0.0
     else:
-        state['parameters']['min_initial_hue_separation'] = 0.0
-        state['parameters']['max_initial_hue_separation'] = 0.0
+        state.parameters['min_initial_hue_separation'] = 0.0
+        state.parameters['max_initial_hue_separation'] = 0.0
 
     arc_iter = marked_arcs(360 / num_samples)
 
@@ -561,17 +1251,17 @@ def _div_cmap_setup(state, arc, max_arc_length, min_arc_length, div_type):
         return False
 
     if div_type == 'hill':
-        state['cmap']['sequence_data'] = np.array(
+        state.cmap['sequence_data'] = np.array(
             [lb, mark - lb, ub, mark - ub]
             )
-        state['parameters']['center_initial_hue'] = np.array([lb, ub])
-        state['parameters']['center_final_hue'] = np.array([mark, mark])
+        state.parameters['center_initial_hue'] = np.array([lb, ub])
+        state.parameters['center_final_hue'] = np.array([mark, mark])
     else:
-        state['cmap']['sequence_data'] = np.array(
+        state.cmap['sequence_data'] = np.array(
             [mark, lb - mark, mark, ub - mark]
             )
-        state['parameters']['center_initial_hue'] = np.array([mark, mark])
-        state['parameters']['center_final_hue'] = np.array([lb, ub])
+        state.parameters['center_initial_hue'] = np.array([mark, mark])
+        state.parameters['center_final_hue'] = np.array([lb, ub])
 
     return True
 
@@ -584,30 +1274,27 @@ def make_div(
         similarity_threshold,
         max_arc_length,
         min_arc_length,
+        *,
+        deadline=None,
+        **search_options,
         ):
-    return (
-        *_make(
-            DIVERGENT_HILL_PARAMETERS,
-            colorfulness,
-            span,
-            num_samples,
-            lightness_threshold,
-            similarity_threshold,
-            functools.partial(
-                _div_initial_setup,
-                div_type='hill',
-                ),
-            functools.partial(
-                _div_cmap_setup,
-                max_arc_length=max_arc_length,
-                min_arc_length=min_arc_length,
-                div_type='hill',
-                ),
-            run.create_multiseq,
-            _mseq_cmap_filter,
-            ),
-        *_make(
-            DIVERGENT_VALLEY_PARAMETERS,
+    # Hill and valley colormaps are searched in separate passes.  With
+    # a deadline, the hill pass gets half of the remaining time and
+    # the valley pass gets the rest, including whatever the hill pass
+    # did not use, so that both kinds of candidate are attempted.
+    if deadline is None:
+        hill_deadline = None
+    else:
+        now = time.monotonic()
+        hill_deadline = now + max(deadline - now, 0) / 2
+
+    found = []
+    for div_type, parameters, pass_deadline in (
+            ('hill', DIVERGENT_HILL_PARAMETERS, hill_deadline),
+            ('valley', DIVERGENT_VALLEY_PARAMETERS, deadline),
+            ):
+        found.extend(_make(
+            parameters,
             colorfulness,
             span,
             num_samples,
@@ -615,25 +1302,27 @@ def make_div(
             similarity_threshold,
             functools.partial(
                 _div_initial_setup,
-                div_type='valley',
+                div_type=div_type,
                 ),
             functools.partial(
                 _div_cmap_setup,
                 max_arc_length=max_arc_length,
                 min_arc_length=min_arc_length,
-                div_type='valley',
+                div_type=div_type,
                 ),
             run.create_multiseq,
             _mseq_cmap_filter,
-            ),
-        )
+            deadline=pass_deadline,
+            **search_options,
+            ))
+    return tuple(found)
 
 
 def _cyc_initial_setup(state, colorfulness, span, num_samples):
-    state['cmap']['chroma'] = colorfulness
-    state['parameters']['min_chroma'] = colorfulness
-    state['parameters']['max_chroma'] = colorfulness
-    state['parameters']['span_hue'] = span / 2
+    state.cmap['chroma'] = colorfulness
+    state.parameters['min_chroma'] = colorfulness
+    state.parameters['max_chroma'] = colorfulness
+    state.parameters['span_hue'] = span / 2
 
     angle_iter = np.linspace(0, 360, num_samples, dtype=np.float64)
 
@@ -644,8 +1333,8 @@ def _cyc_initial_setup(state, colorfulness, span, num_samples):
 
 
 def _cyc_cmap_setup(state, angle):
-    state['cmap']['sequence_data'] = np.array(angle)
-    state['parameters']['center_hue'] = angle
+    state.cmap['sequence_data'] = np.array(angle)
+    state.parameters['center_hue'] = angle
     return True
 
 
@@ -659,6 +1348,7 @@ def make_cyc(
         lightness_threshold,
         colorfulness,
         similarity_threshold,
+        **search_options,
         ):
     return _make(
         CYCLIC_PARAMETERS,
@@ -671,15 +1361,16 @@ def make_cyc(
         _cyc_cmap_setup,
         run.create_cyclic,
         _cyc_cmap_filter,
+        **search_options,
         )
 
 
 def _isolum_initial_setup(state, colorfulness, span, num_samples):
-    state['cmap']['chroma'] = colorfulness
-    state['parameters']['min_chroma'] = colorfulness
-    state['parameters']['max_chroma'] = colorfulness
-    state['parameters']['span_initial_hue'] = span / 2
-    state['parameters']['span_final_hue'] = span / 2
+    state.cmap['chroma'] = colorfulness
+    state.parameters['min_chroma'] = colorfulness
+    state.parameters['max_chroma'] = colorfulness
+    state.parameters['span_initial_hue'] = span / 2
+    state.parameters['span_final_hue'] = span / 2
 
     arc_iter = arcs_around_circle(360 / num_samples, 1)
 
@@ -695,8 +1386,8 @@ def _isolum_initial_setup(state, colorfulness, span, num_samples):
 
 
 def _isolum_cmap_setup(state, angle):
-    state['cmap']['sequence_data'] = np.array(angle)
-    state['parameters']['center_hue'] = angle
+    state.cmap['sequence_data'] = np.array(angle)
+    state.parameters['center_hue'] = angle
     return True
 
 
@@ -711,6 +1402,7 @@ def make_isolum(
         similarity_threshold,
         max_arc_length,
         min_arc_length,
+        **search_options,
         ):
     return _make(
         ISOLUM_PARAMETERS,
@@ -727,4 +1419,28 @@ def make_isolum(
             ),
         run.create_multiseq,
         _isolum_cmap_filter,
+        **search_options,
         )
+
+
+def count_candidates(make_fn, *args, **kwargs):
+    """Returns the number of candidates in a search
+
+    make_fn is one of the make_* functions, called with args and
+    kwargs but without solving any candidates.  Searches that make
+    several passes over their grid, like make_div, count the
+    largest pass.
+    """
+
+    log = SearchLog(progress_interval=np.inf)
+    make_fn(*args, **kwargs, candidate_range=(0, 0), log=log)
+    return max(settings['num_candidates'] for settings in log.searches)
+
+
+# Filters applied by _make to each color map type, used when
+# judging stored results again.
+CMAP_FILTERS = {
+    'Multisequential': _mseq_cmap_filter,
+    'Divergent': _mseq_cmap_filter,
+    'Cyclic': _cyc_cmap_filter,
+    }
@@ -14,7 +14,7 @@ import click
 import matplotlib.pyplot as plt
 import numpy as np
 
-from . import conversion
+from . import archive, conversion
 
 
 def search_cmap_names(cp, regexp, include_aliases):
@@ -50,7 +50,7 @@ def search_cmap_names(cp, regexp, include_aliases):
     '-f',
     type=click.File('rb'),
     multiple=True,
-    help="Color map file to show",
+    help="Color map file or archive to show",
     )
 @click.option(
     '--include-aliases/--exclude-aliases',
@@ -100,7 +100,10 @@ def show(ctx, chromophile, include_aliases, file, regexp, output, display):
 
     cmap_file = {}
     for f in file:
-        cmap_file[pathlib.Path(f.name).stem] = f.read()
+        if archive.is_archive(f.name):
+            cmap_file.update(archive.read_cmaps(f.name))
+        else:
+            cmap_file[pathlib.Path(f.name).stem] = f.read()
 
     obj['chromophile'] = chromophile_mod
     obj['cmap_names'] = cmap_names
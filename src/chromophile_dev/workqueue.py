@@ -0,0 +1,338 @@
+"""
+A work queue for running searches on several machines
+
+The queue is a directory on a shared file system, such as NFS,
+and needs no other services.  It contains:
+
+* search.json, describing the search and how it was divided.
+
+* pending/, holding one task file per range of candidates that
+  has not been claimed.
+
+* leased/, holding the task files of claimed ranges.  A worker
+  claims a task by renaming it from pending/ to leased/, which
+  succeeds for exactly one worker, and keeps the lease alive by
+  updating its modification time.  A lease that has not been
+  renewed for lease_time seconds is renamed back to pending/.
+
+* done/, holding an SQLite results database for each finished
+  range.
+
+Ranges are searched with _make exactly as in a local search,
+except that candidates are not compared with those accepted in
+other ranges.  Merging concatenates the results in the order of
+the ranges and judges every candidate again, so the similarity
+filter is applied to the whole search deterministically.
+"""
+
+import json
+import os
+import pathlib
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from . import results, search
+
+
+SEARCH_FILE = 'search.json'
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+
+
+def _task_name(chunk):
+    return f"{chunk:06d}"
+
+
+def _write_atomically(path, data):
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}")
+    with open(temporary_path, 'w') as file_handle:
+        file_handle.write(data)
+    os.replace(temporary_path, path)
+
+
+def create(
+        directory,
+        function,
+        args,
+        kwargs,
+        search_options,
+        chunk_size,
+        lease_time,
+        ):
+    """Divides a search into tasks in directory
+
+    The search is search.<function>(*args, **kwargs,
+    **search_options).  Each task covers chunk_size consecutive
+    candidates.  Returns the number of tasks.
+    """
+
+    make_fn = getattr(search, function)
+    num_candidates = search.count_candidates(make_fn, *args, **kwargs)
+    num_chunks = -(-num_candidates // chunk_size)
+
+    directory.mkdir(parents=True, exist_ok=True)
+    if (directory / SEARCH_FILE).exists():
+        raise RuntimeError(f"{directory} already contains a search")
+    for subdirectory in (PENDING, LEASED, DONE):
+        (directory / subdirectory).mkdir()
+
+    for chunk in range(num_chunks):
+        task = {
+            'chunk': chunk,
+            'candidate_range': [
+                chunk * chunk_size,
+                min((chunk + 1) * chunk_size, num_candidates),
+                ],
+            }
+        _write_atomically(
+            directory / PENDING / f"{_task_name(chunk)}.json",
+            json.dumps(task),
+            )
+
+    # search.json is written last, so workers never find a
+    # partially created queue.
+    spec = {
+        'function': function,
+        'args': args,
+        'kwargs': kwargs,
+        'search_options': search_options,
+        'num_candidates': num_candidates,
+        'num_chunks': num_chunks,
+        'lease_time': lease_time,
+        }
+    _write_atomically(directory / SEARCH_FILE, json.dumps(spec, indent=4))
+
+    return num_chunks
+
+
+def read_spec(directory):
+    with open(directory / SEARCH_FILE) as file_handle:
+        return json.load(file_handle)
+
+
+def claim(directory):
+    """Claims a pending task
+
+    Returns the lease's path, or None if no task is pending.
+    """
+
+    for path in sorted((directory / PENDING).glob('*.json')):
+        if (directory / DONE / f"{path.stem}.db").exists():
+            # The task was re-issued after its worker finished.
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            continue
+
+        lease_path = directory / LEASED / path.name
+        try:
+            os.rename(path, lease_path)
+        except FileNotFoundError:
+            # Another worker claimed it first.
+            continue
+        os.utime(lease_path)
+        return lease_path
+
+    return None
+
+
+def _shared_time(directory):
+    """Returns the current time on the file system holding directory
+
+    Leases are renewed by setting their modification times, which
+    a network file system takes from its server's clock, so they
+    are compared with the modification time of a newly touched
+    file rather than with this machine's clock.
+    """
+
+    probe_path = directory / f".clock.{socket.gethostname()}.{os.getpid()}"
+    try:
+        probe_path.touch()
+        return probe_path.stat().st_mtime
+    finally:
+        try:
+            probe_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def reissue_expired(directory, lease_time):
+    """Returns expired leases to pending/ and returns their number"""
+
+    count = 0
+    now = _shared_time(directory)
+    for lease_path in (directory / LEASED).glob('*.json'):
+        try:
+            expired = now - lease_path.stat().st_mtime > lease_time
+            if expired:
+                os.rename(lease_path, directory / PENDING / lease_path.name)
+                count += 1
+        except FileNotFoundError:
+            continue
+
+    return count
+
+
+def _renew_lease(lease_path, interval, stop):
+    while not stop.wait(interval):
+        try:
+            os.utime(lease_path)
+        except FileNotFoundError:
+            # The lease expired and was re-issued.  Finishing the
+            # task is harmless, since both results are identical.
+            return
+
+
+def run_task(directory, spec, lease_path, verbose=0, progress_interval=60.0):
+    """Searches the range of candidates in a leased task"""
+
+    with open(lease_path) as file_handle:
+        task = json.load(file_handle)
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=_renew_lease,
+        args=(lease_path, spec['lease_time'] / 4, stop),
+        daemon=True,
+        )
+    heartbeat.start()
+
+    # The database is built on local disk, where SQLite's locking
+    # is reliable, and then moved into place.
+    file_descriptor, local_path = tempfile.mkstemp(suffix='.db')
+    os.close(file_descriptor)
+    try:
+        store = results.ResultStore(local_path)
+        log = search.SearchLog(verbose, progress_interval, store=store)
+        getattr(search, spec['function'])(
+            *spec['args'],
+            **spec['kwargs'],
+            **spec['search_options'],
+            candidate_range=task['candidate_range'],
+            log=log,
+            )
+        log.report()
+        store.close()
+
+        done_path = directory / DONE / f"{lease_path.stem}.db"
+        shared_path = done_path.with_name(
+            f".{done_path.name}.{socket.gethostname()}.{os.getpid()}"
+            )
+        shutil.copyfile(local_path, shared_path)
+        os.replace(shared_path, done_path)
+    finally:
+        stop.set()
+        heartbeat.join()
+        os.remove(local_path)
+
+    try:
+        lease_path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def work(directory, poll_interval=10.0, verbose=0, progress_interval=60.0):
+    """Runs tasks until every task in directory is done
+
+    When no task is pending but some are leased, the worker waits,
+    re-issuing leases that expire.  Returns the number of tasks
+    this worker completed.
+    """
+
+    spec = read_spec(directory)
+    count = 0
+    while True:
+        lease_path = claim(directory)
+        if lease_path is not None:
+            print(f"Running task {lease_path.stem}")
+            run_task(directory, spec, lease_path, verbose, progress_interval)
+            count += 1
+            continue
+
+        if reissue_expired(directory, spec['lease_time']):
+            continue
+        if not any((directory / LEASED).glob('*.json')):
+            return count
+        time.sleep(poll_interval)
+
+
+def status(directory):
+    """Returns the number of pending, leased, and finished tasks"""
+
+    return {
+        PENDING: len(list((directory / PENDING).glob('*.json'))),
+        LEASED: len(list((directory / LEASED).glob('*.json'))),
+        DONE: len(list((directory / DONE).glob('*.db'))),
+        }
+
+
+def merge(directory, database):
+    """Combines the results of every task into database
+
+    The tasks' searches and candidates are copied in task order,
+    so the candidates of each search in database are in the same
+    order as in a local search.  Returns an open connection to
+    database.
+    """
+
+    spec = read_spec(directory)
+    chunk_paths = [
+        directory / DONE / f"{_task_name(chunk)}.db"
+        for chunk in range(spec['num_chunks'])
+        ]
+    missing = [path.stem for path in chunk_paths if not path.exists()]
+    if missing:
+        raise RuntimeError(
+            f"{len(missing)} tasks are not done, starting with {missing[0]}"
+            )
+
+    database = pathlib.Path(database)
+    if database.exists():
+        database.unlink()
+    connection = results.connect(database)
+
+    search_columns = ', '.join(results.SEARCH_COLUMNS)
+    candidate_columns = ', '.join(
+        c for c in results.CANDIDATE_COLUMNS if c != 'search_id'
+        )
+    search_ids = None
+    for path in chunk_paths:
+        connection.execute("ATTACH DATABASE ? AS chunk", (str(path),))
+        chunk_search_ids = [
+            row['id']
+            for row in connection.execute(
+                "SELECT id FROM chunk.searches ORDER BY id"
+                )
+            ]
+
+        # Every task makes the same passes over the grid, so the
+        # first task's searches stand for all of them.
+        if search_ids is None:
+            search_ids = []
+            for chunk_search_id in chunk_search_ids:
+                cursor = connection.execute(
+                    f"INSERT INTO searches ({search_columns})"
+                    f" SELECT {search_columns} FROM chunk.searches"
+                    " WHERE id = ?",
+                    (chunk_search_id,),
+                    )
+                search_ids.append(cursor.lastrowid)
+
+        for search_id, chunk_search_id in zip(
+                search_ids, chunk_search_ids, strict=True,
+                ):
+            connection.execute(
+                f"INSERT INTO candidates (search_id, {candidate_columns})"
+                f" SELECT ?, {candidate_columns} FROM chunk.candidates"
+                " WHERE search_id = ? ORDER BY id",
+                (search_id, chunk_search_id),
+                )
+        connection.commit()
+        connection.execute("DETACH DATABASE chunk")
+
+    return connection
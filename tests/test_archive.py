@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from chromophile_dev import archive
+
+
+def _cmap(value):
+    return np.full((4, 3), value, dtype=np.uint8)
+
+
+def test_round_trip(tmp_path):
+    filename = tmp_path / f"cmaps{archive.SUFFIX}"
+    with archive.ArchiveWriter(filename) as writer:
+        writer.add('b', _cmap(2))
+        writer.add('a', _cmap(1))
+
+    cmaps = archive.read_cmaps(filename)
+    assert [name for name, _ in cmaps] == ['a', 'b']
+    assert bytes(cmaps[1][1]) == _cmap(2).tobytes()
+    assert [path.name for path in tmp_path.iterdir()] == [filename.name]
+
+
+def test_corrupt_cmap_is_detected_when_read(tmp_path):
+    filename = tmp_path / f"cmaps{archive.SUFFIX}"
+    with archive.ArchiveWriter(filename) as writer:
+        writer.add('a', _cmap(1))
+        writer.add('b', _cmap(2))
+    data = bytearray(filename.read_bytes())
+    data[-1] ^= 0xff
+    filename.write_bytes(data)
+
+    with archive.Archive(filename) as cmaps:
+        assert bytes(cmaps['a']) == _cmap(1).tobytes()
+        with pytest.raises(ValueError, match="Color map b"):
+            cmaps['b']
+        with pytest.raises(ValueError):
+            cmaps.verify()
+    with pytest.raises(ValueError):
+        archive.read_cmaps(filename)
+
+
+def test_failed_write_leaves_no_temporary_files(tmp_path):
+    filename = tmp_path / f"cmaps{archive.SUFFIX}"
+    with archive.ArchiveWriter(filename) as writer:
+        writer.add('a', _cmap(1))
+    data = bytearray(filename.read_bytes())
+    data[-1] ^= 0xff
+    filename.write_bytes(data)
+
+    # Copying the corrupt color map from the old archive fails.
+    with pytest.raises(ValueError):
+        with archive.ArchiveWriter(filename) as writer:
+            writer.add('b', _cmap(2))
+    assert [path.name for path in tmp_path.iterdir()] == [filename.name]
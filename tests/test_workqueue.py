@@ -0,0 +1,100 @@
+import multiprocessing
+import types
+
+import pytest
+
+from chromophile_dev import results, search, workqueue
+
+
+SEARCH_ARGS = [12, 30, 0.3, 0.1, 5]
+SEARCH_KWARGS = {
+    'num_seqs': 1,
+    'max_arc_length': 360,
+    'min_arc_length': 0,
+    'num_extra_revolutions': 0,
+    }
+
+
+def _create_multiseq(state):
+    # Stands in for the optimizer, so that the candidates' fates
+    # depend only on their grid points.
+    _, arc = state.cmap.sequence_data
+    state.cmap['initial_lightness'] = 0.1
+    state.cmap['final_lightness'] = 0.1 + abs(arc) / 360
+    state.runtime['opt_result'] = types.SimpleNamespace(nit=0)
+    state.runtime['opt_time'] = 0.0
+
+
+@pytest.fixture(autouse=True)
+def fake_optimizer(monkeypatch):
+    monkeypatch.setattr(search.run, 'create_multiseq', _create_multiseq)
+
+
+def _work(directory, counts):
+    counts.put(workqueue.work(directory, poll_interval=0.1))
+
+
+def _candidate_names(connection):
+    return [
+        row['name']
+        for row in connection.execute(
+            "SELECT name FROM candidates ORDER BY id"
+            )
+        ]
+
+
+def test_workers_complete_every_task_once(tmp_path):
+    store = results.ResultStore(tmp_path / 'local.db')
+    local_states = search.make_mseq(
+        *SEARCH_ARGS,
+        **SEARCH_KWARGS,
+        log=search.SearchLog(store=store),
+        )
+    store.flush()
+
+    directory = tmp_path / 'queue'
+    num_chunks = workqueue.create(
+        directory, 'make_mseq', SEARCH_ARGS, SEARCH_KWARGS, {}, 20, 60.0,
+        )
+    assert num_chunks > 4
+
+    # The workers are forked, so they share the fake optimizer.
+    context = multiprocessing.get_context('fork')
+    counts = context.Queue()
+    workers = [
+        context.Process(target=_work, args=(directory, counts))
+        for _ in range(4)
+        ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=120)
+        assert worker.exitcode == 0
+
+    assert sum(counts.get() for _ in workers) == num_chunks
+    assert workqueue.status(directory) == {
+        workqueue.PENDING: 0,
+        workqueue.LEASED: 0,
+        workqueue.DONE: num_chunks,
+        }
+
+    connection = workqueue.merge(directory, tmp_path / 'merged.db')
+    assert _candidate_names(connection) == _candidate_names(store.connection)
+    assert (
+        [state.name for state in results.select(connection)]
+        == [state.name for state in local_states]
+        )
+
+
+def test_expired_leases_are_reissued(tmp_path):
+    directory = tmp_path / 'queue'
+    workqueue.create(
+        directory, 'make_mseq', SEARCH_ARGS, SEARCH_KWARGS, {}, 20, 60.0,
+        )
+    lease_path = workqueue.claim(directory)
+
+    assert workqueue.reissue_expired(directory, 60.0) == 0
+    assert workqueue.reissue_expired(directory, -1.0) == 1
+    assert not lease_path.exists()
+    assert (directory / workqueue.PENDING / lease_path.name).exists()
+    assert not list(directory.glob('.clock.*'))